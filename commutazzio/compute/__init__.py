@@ -3,6 +3,8 @@
 from .connected_persistence_diagram import ConnectedPersistenceDiagram
 from .decomposition_container import Decomposition
 from .precompute import CommutativeGridPreCompute
+from .executor import CLExecutor
+from .batch import batch_cPD
 from .connected_persistence_diagram import ConnectedPersistenceDiagram as cPD
 # from .connected_persistence_diagram_stable import ConnectedPersistenceDiagram as cPDS
 # from .connected_persistence_diagram_nightly import ConnectedPersistenceDiagram as cPDN
\ No newline at end of file
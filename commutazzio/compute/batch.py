@@ -0,0 +1,140 @@
+"""
+Connected persistence diagrams of many filtrations, computed together.
+
+The intervals and the covers are loaded once per ladder length,
+and the zigzags of all the filtrations go through one pool of workers:
+
+    for i, diagram in batch_cPD(filtrations, homology_dim=1, num_cores=8):
+        ...  # diagram is the cPD of filtrations[i], yielded as soon as it is complete
+
+Up to max_pending filtrations are in flight at once, so the workers never wait
+for a filtration to finish before starting on the next one,
+while the memory stays bounded by the delta stores of max_pending filtrations.
+"""
+import queue
+from os import cpu_count
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from .connected_persistence_diagram import ConnectedPersistenceDiagram
+from .checkpoint import BarcodeCheckpoint
+from .executor import CLExecutor
+from ..filtration import CLFiltration
+
+
+def batch_cPD(filtrations, homology_dim, ladder_length=None, filtration_values=None,
+              num_cores:int=-1, executor=None, algorithm_phat:str='chunk_reduction',
+              backend:str='processes', max_pending:int=None,
+              reduce_complexes:bool=False):
+    """
+    Generator of (i, diagram), the ConnectedPersistenceDiagram of filtrations[i],
+    in the order in which the diagrams are completed.
+    filtrations: an iterable of CLFiltration objects or of paths to filtration files,
+        consumed lazily
+    homology_dim: a dimension or a list of dimensions, as for ConnectedPersistenceDiagram
+    ladder_length, filtration_values: for the filtration files,
+        a CLFiltration carries its own
+    num_cores: number of workers, -1 for all the cores but two
+    executor: an optional CLExecutor to run the zigzags on, otherwise a pool is started for the batch
+    backend: 'processes' or 'threads', see ConnectedPersistenceDiagram
+    max_pending: number of filtrations in flight, 2*num_cores by default
+    reduce_complexes: collapse the complexes before the zigzags, see ConnectedPersistenceDiagram
+    """
+    if backend not in ('processes', 'threads'):
+        raise ValueError(f"Unknown backend {backend}, use 'processes' or 'threads'.")
+    own_pool = None
+    if backend == 'threads':
+        if num_cores == -1: # if -1 then default to max_cores-2
+            num_cores = max(1, cpu_count()-2)
+        own_pool = runner = ThreadPool(processes=num_cores)
+    elif executor is None:
+        own_pool = runner = CLExecutor(num_cores=num_cores)
+        num_cores = runner.num_cores
+    else:
+        runner = executor
+        num_cores = executor.num_cores
+    if max_pending is None:
+        max_pending = 2*num_cores
+    results = queue.Queue() # (i, results or exception), filled by the callbacks of the pool
+    pending = {} # i -> [diagram, number of pairs left, shared memory, task, lengths of the pairs]
+    rows = [BarcodeCheckpoint.UPPER, BarcodeCheckpoint.LOWER]
+
+    def submit(i, batches):
+        """queue batches of jobs (b0,d1,algorithm_phat) of filtrations[i], their results come back in results"""
+        task = pending[i][3]
+        for batch in batches:
+            runner.apply_async(task[0], (task[1](batch),),
+                               callback=lambda r, i=i: results.put((i, r)),
+                               error_callback=lambda e, i=i: results.put((i, e)))
+
+    def start(i, filtration):
+        if isinstance(filtration, CLFiltration):
+            source = {'clf': filtration}
+        else:
+            source = {'filtration_filepath': filtration, 'ladder_length': ladder_length, 'filtration_values': filtration_values}
+        # the tables of each ladder length are loaded once, see precomputed_tables
+        diagram = ConnectedPersistenceDiagram(homology_dim=homology_dim, **source,
+                                              algorithm_phat=algorithm_phat, backend=backend, deferred=True,
+                                              reduce_complexes=reduce_complexes)
+        shm = None
+        if backend == 'threads':
+            deltas = diagram.deltas
+            def compute_batch(batch):
+                return [ConnectedPersistenceDiagram.fzz_timed_job(deltas, b0, d1, algorithm_phat) for b0, d1, _ in batch]
+            task = (compute_batch, lambda batch: batch)
+        else:
+            shm, handle = diagram.deltas.share()
+            task = (ConnectedPersistenceDiagram.fzz_compute_batch_mp, lambda batch: (handle, batch))
+        pending[i] = [diagram, None, shm, task, None]
+        # the rows first, in one batch, they decide which pairs do not vanish
+        submit(i, [[(b0, d1, algorithm_phat) for b0, d1 in rows]])
+
+    def release(i):
+        shm = pending.pop(i)[2]
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    filtrations = enumerate(filtrations)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    start(*next(filtrations))
+                except StopIteration:
+                    exhausted = True
+            if not pending:
+                break
+            i, result = results.get()
+            if isinstance(result, BaseException):
+                raise result
+            diagram = pending[i][0]
+            if pending[i][1] is None:
+                # the rows are done
+                done = {key: np.asarray(barcode, dtype=np.int64).reshape(-1, 3) for key, barcode, _ in result}
+                todo = diagram._prepare_deco(done=done)
+                pending[i][1] = len(todo)
+                costs = [diagram.deltas.pair_length(b0, d1) for b0, d1 in todo]
+                pending[i][4] = dict(zip(todo, costs))
+                args_list = [(b0, d1, algorithm_phat) for b0, d1 in todo]
+                submit(i, ConnectedPersistenceDiagram.schedule_jobs(args_list, costs, num_cores))
+            else:
+                # the pairs of a batch interleave with the other filtrations,
+                # there is no pairs phase in diagram.stats, only the time of each zigzag
+                for (b0, d1), barcode, seconds in result:
+                    diagram.stats.add_pair(b0, d1, pending[i][4][(b0, d1)], seconds)
+                    diagram._store_barcode(b0, d1, barcode)
+                pending[i][1] -= len(result)
+            if pending[i][1] == 0:
+                release(i)
+                diagram._complete(*diagram._finish_deco())
+                yield i, diagram
+        if own_pool is None and backend == 'processes':
+            # the workers switch blocks with their next batch, once the batch is done
+            # the workers of the executor release the block of the last diagram they computed
+            runner.broadcast(ConnectedPersistenceDiagram._detach_worker_deltas)
+    finally:
+        for i in list(pending):
+            release(i)
+        if own_pool is not None:
+            own_pool.terminate()
@@ -0,0 +1,76 @@
+"""
+Checkpoint of the zigzag barcodes computed by ConnectedPersistenceDiagram.deco().
+
+Every finished barcode is appended to one file as a record
+    magic (4 bytes) | b0 (int32) | d1 (int32) | number of bars (int64) | bars (int64, 3 per bar)
+written by a single os.write on a file opened in append mode, then fsync'ed.
+A crash can only leave an incomplete last record, which is dropped when the file is loaded.
+The upper and lower rows are stored with the keys UPPER and LOWER.
+
+c_ss is not stored, it is recomputed from the barcodes with a few cumsums.
+"""
+import os
+import numpy as np
+
+
+class BarcodeCheckpoint():
+    MAGIC = b'CPD1'
+    HEADER = np.dtype([('magic', 'S4'), ('b0', '<i4'), ('d1', '<i4'), ('count', '<i8')])
+    UPPER = (-1, 1)
+    LOWER = (-1, 0)
+
+    def __init__(self, dirpath, fingerprint):
+        """
+        dirpath: the checkpoint directory, created if needed
+        fingerprint: identifies the input, a checkpoint is only resumed by a run with the same fingerprint
+        """
+        os.makedirs(dirpath, exist_ok=True)
+        self.filepath = os.path.join(dirpath, f"cpd_{fingerprint}.ckpt")
+        self._fd = None
+
+    def load(self):
+        """
+        Returns the barcodes already stored, as a dict from (b0,d1) to int64 arrays of shape (k,3).
+        An incomplete last record is truncated away.
+        """
+        barcodes = {}
+        if not os.path.exists(self.filepath):
+            return barcodes
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + self.HEADER.itemsize <= len(data):
+            header = np.frombuffer(data, dtype=self.HEADER, count=1, offset=offset)[0]
+            end = offset + self.HEADER.itemsize + 24*int(header['count'])
+            if header['magic'] != self.MAGIC or end > len(data):
+                break
+            bars = np.frombuffer(data, dtype='<i8', count=3*int(header['count']), offset=offset+self.HEADER.itemsize)
+            barcodes[(int(header['b0']), int(header['d1']))] = bars.reshape(-1, 3).astype(np.int64)
+            offset = end
+        if offset < len(data):
+            with open(self.filepath, 'r+b') as f:
+                f.truncate(offset)
+        return barcodes
+
+    def append(self, key, barcode):
+        """append the barcode of key=(b0,d1), durable once returned"""
+        if self._fd is None:
+            self._fd = os.open(self.filepath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        bars = np.asarray(barcode, dtype='<i8').reshape(-1, 3)
+        header = np.array([(self.MAGIC, key[0], key[1], len(bars))], dtype=self.HEADER)
+        record = header.tobytes() + bars.tobytes()
+        written = os.write(self._fd, record)
+        if written != len(record):
+            raise OSError(f"Incomplete write to the checkpoint {self.filepath}")
+        os.fsync(self._fd)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def remove(self):
+        """delete the checkpoint, once the run is complete"""
+        self.close()
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
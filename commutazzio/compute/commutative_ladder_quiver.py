@@ -55,17 +55,26 @@ def filtration_input(self,upper_row,lower_row):
         print("Filtration updated.")
     
     #@timeit
-    def tours_vector(self,dim,prime,enable_multi_processing,num_cores:int):
+    def tours_vector(self,dim,prime,enable_multi_processing,num_cores:int,executor=None,backend:str='processes'):
         """
         Returns the vector of all the tours over the simplicial complex.
         mp_method: multiprocessing method, 0 for none, 1 for pool
         num_cores: int
+        executor: an optional CLExecutor, its long-lived pool is used instead of starting a new one
+        backend: 'processes' or 'threads', used when enable_multi_processing is True and no executor is given
         """
+        if backend not in ('processes', 'threads'):
+            raise ValueError(f"Unknown backend {backend}, use 'processes' or 'threads'.")
         m=self.shape[0]
         if set(self.orientation)!={'f'} or (m!=3 and m!=4):
             raise NotImplementedError("Incompatible orientation.")
         total_courses=len(self.courses)
-        if enable_multi_processing == False:
+        if executor is not None:
+            params = [(self.attribute_sequence(course,"simplicial_complex"),dim,prime) for course in self.courses.values()]
+            print(f"Computing multiplicity vector @ dim={dim} with prime={prime}...")
+            results = executor.starmap(self.multiplicity_zigzag, params)
+            vector_list = [[result] for result in results]
+        elif enable_multi_processing == False:
             vector_list = []
             for i, course in enumerate(self.courses.values()):
                 # a course is a sequence of nodes
@@ -95,7 +104,7 @@ def tours_vector(self,dim,prime,enable_multi_processing,num_cores:int):
             # add prompt telling that the progress bar is for xxxx
             print(f"Computing multiplicity vector @ dim={dim} with prime={prime}...")
             with tqdm_joblib(tqdm(desc="Progress",total=total_courses)) as progress_bar:
-                results = Parallel(n_jobs=num_cores)(delayed(self.multiplicity_zigzag)(*param) for param in params)
+                results = Parallel(n_jobs=num_cores,prefer=backend)(delayed(self.multiplicity_zigzag)(*param) for param in params)
             # results = Parallel(n_jobs=8)(delayed(self.multiplicity_zigzag)(*param) for param in params)
             # results= Parallel(n_jobs=2)(delayed(self.computePD)(param) for param in params)
             # with Pool() as pool: # the same as Pool(os.cpu_count())
@@ -108,13 +117,13 @@ def tours_vector(self,dim,prime,enable_multi_processing,num_cores:int):
 
         
 
-    def multiplicity_computation(self,dim=1,prime=2,recalculate=False,output_message=True,enable_multi_processing=False,num_cores=1):
+    def multiplicity_computation(self,dim=1,prime=2,recalculate=False,output_message=True,enable_multi_processing=False,num_cores=1,executor=None,backend='processes'):
         """Return the vector of multiplicities"""
         
         if len(self.decomp_collection.dim(dim).prime(prime).collection)!=0 and not recalculate:
             print("Data already exists. Use `recalculate=True` to force recalculation.")
         else:
-            b=self.tours_vector(dim=dim,prime=prime,enable_multi_processing=enable_multi_processing,num_cores=num_cores)
+            b=self.tours_vector(dim=dim,prime=prime,enable_multi_processing=enable_multi_processing,num_cores=num_cores,executor=executor,backend=backend)
             result=np.linalg.solve(self.coeff_mat,b)
             rounded=result.round().astype(int)
             error=np.linalg.norm(np.matmul(self.coeff_mat,rounded)-b)
@@ -1,7 +1,6 @@
 from .commutative_ladder_quiver import CommutativeLadderQuiver as CLQ
 from .connected_persistence_diagram import ConnectedPersistenceDiagram as cPD
 from ..filtration import CLFiltration
-from ..utils import create_directory, delete_file
 from functools import cache
 from icecream import ic
 import gc
@@ -14,7 +13,14 @@
 class CLInvariants:
     def __init__(self, clf: CLFiltration,\
                  enable_multi_processing:bool=False,\
-                    num_cores:int=-1,algorithm_phat:str="chunk_reduction",verbose:bool=False):
+                    num_cores:int=-1,algorithm_phat:str="chunk_reduction",verbose:bool=False,\
+                        executor=None,backend:str='processes',reduce_complexes:bool=False):
+        """
+        executor: an optional CLExecutor, a long-lived pool of workers
+            used by all the computations, and reusable across filtrations
+        backend: 'processes' or 'threads', how the zigzags are computed in parallel
+        reduce_complexes: collapse the complexes before computing the cPD, the result is the same
+        """
         self.clf = clf
         if len(clf) in [3,4]:
             self.quiver = CLQ(len(clf),verbose=verbose)
@@ -23,21 +29,19 @@ def __init__(self, clf: CLFiltration,\
         else:
             self.ladder_type = "infinite"
         self.connected_persistence_diagrams = []
-        create_directory('./filtration')
-        self._filtration_file_ready = False
         self._enable_multi_processing = enable_multi_processing
         self._num_cores = num_cores
         self._algorithm_phat = algorithm_phat
         self._verbose = verbose
+        self._executor = executor
+        self._backend = backend
+        self._reduce_complexes = reduce_complexes
 
 
     def __enter__(self):
         return self
     
     def __exit__(self, exc_type, exc_value, traceback):
-        if self._filtration_file_ready:
-            self.delete_filtration_file()
-            self._filtration_file_ready = False
         for diagram in self.connected_persistence_diagrams:
             del diagram
         self.connected_persistence_diagrams = []
@@ -45,9 +49,6 @@ def __exit__(self, exc_type, exc_value, traceback):
 
 
     def __del__(self):
-        if self._filtration_file_ready:
-            self.delete_filtration_file()
-            self._filtration_file_ready = False
         for diagram in self.connected_persistence_diagrams:
             del diagram
         self.connected_persistence_diagrams = []
@@ -65,34 +66,20 @@ def cPD_computation(self,homology_dim=1):
         (Can choose other finite field if we use dionysus2)
         """
         print(f"Computing connected persistence diagram at homology dimension {homology_dim}")
-        if self._filtration_file_ready == False:
-            self.filtration_filepath=self.clf.random_cech_format_output_file(new_file=True,dirname='./filtration',extension='fltr')
-            self._filtration_file_ready = True
         params={
-            'filtration_filepath':self.filtration_filepath,
-            'ladder_length':self.clf.ladder_length,
+            'clf':self.clf, # passed in memory, no filtration file is written
             'homology_dim':homology_dim,
-            'filtration_values':self.clf.horizontal_parameters,
             'enable_multi_processing':self._enable_multi_processing,
             'num_cores':self._num_cores,
             'algorithm_phat':self._algorithm_phat,
-            'verbose':self._verbose
+            'verbose':self._verbose,
+            'executor':self._executor,
+            'backend':self._backend,
+            'reduce_complexes':self._reduce_complexes
         }
         new_diagram=cPD(**params)
         self.connected_persistence_diagrams.append(new_diagram)
 
-    def delete_filtration_file(self):
-        if self._filtration_file_ready == False:
-            print("Filtration file not generated yet.")
-            return
-        try:
-            delete_file(self.filtration_filepath)
-            self._filtration_file_ready = False
-            print("Filtration file deleted.")
-        except Exception as e:
-            print(f"Error: {e}")
-        return 
-
     @cache
     def upper_sc_array(self):
         return [self.clf.get_simplicial_complex(*(x,2)) for x in range(1,len(self.clf)+1)]
@@ -111,7 +98,7 @@ def total_decomposition_computation(self,dim=1,prime=2,recalculate=False,output_
             raise ValueError("Total decomposition is only available for finite-type commutative ladders.")
         if not self.repr_filled:
             self.repr_generation()
-        self.quiver.multiplicity_computation(dim=dim,prime=prime,recalculate=recalculate,output_message=output_message,enable_multi_processing=self._enable_multi_processing,num_cores=self._num_cores)
+        self.quiver.multiplicity_computation(dim=dim,prime=prime,recalculate=recalculate,output_message=output_message,enable_multi_processing=self._enable_multi_processing,num_cores=self._num_cores,executor=self._executor,backend=self._backend)
         if self._verbose:
             print(f"Total decomposition of the homology module at dimension {dim} and finite field F{prime} is computed.")
         
@@ -7,19 +7,23 @@
 import pandas as pd
 import numpy as np
 from bisect import bisect_left
-import os, sys
+import os, sys, time
 #import gc garbage collection
 import configparser
 import pickle
 from warnings import warn
 from icecream import ic
-from functools import lru_cache, partial
-from .precompute import CommutativeGridPreCompute
+from functools import lru_cache
+from .precompute import CommutativeGridPreCompute, DenseCss, MoebiusTable, join_intv, load_precomputed_binary, freeze_precomputed
+from .delta_store import LadderDeltaStore
+from .checkpoint import BarcodeCheckpoint
+from .reduction import reduce_ladder
 # from ..utils import print_memory_usage_of_all_variables
 from pympler import asizeof
-from ..utils import CompressedDict, print_memory_usage
+from ..utils import print_memory_usage
 import logging
-from ..utils.watch import timeit
+from ..utils.watch import timeit, PhaseStats
+from ..filtration import CLFiltration
 # from fzzpy import compute as zz_compute
 # zz_compute = partial(zz_compute, algorithm=self._algorithm_phat)
 # import gc
@@ -38,58 +42,393 @@
 PRECOMPUTED_INTV_DIR = config['storage']['precomputed_intv_dir']
 
 print(PRECOMPUTED_INTV_DIR)
+
+_worker_deltas = None # delta store attached by each worker process, see ConnectedPersistenceDiagram._attach_worker_deltas
+
+PRECOMPUTED_CACHE_SIZE = 8 # number of ladder lengths whose tables are kept in memory, see precomputed_tables
                                          
 
 class ConnectedPersistenceDiagram():
-    __slots__ = ['txf','txf_dir','txf_basename_wo_ext','m','ladder_length',\
+    __slots__ = ['txf','txf_dir','txf_basename_wo_ext','clf','m','ladder_length',\
                  '_enable_multi_processing','_num_cores','_algorithm_phat','clean_up','n','dim',\
                     'times','intv','variables','complexes','delt_ss','d_ss','dec',\
-                        'indexAligner','dots','lines','dotdec','plot_dots',\
-                            'NodeToStr','PathToStr']
-
-    def __init__(self, filtration_filepath,ladder_length,homology_dim,filtration_values,enable_multi_processing:bool=False,num_cores:int=-1,verbose:bool=False,clean_up:bool=True,algorithm_phat:str='chunk_reduction',**kwargs ):
-        self.txf = os.path.abspath(filtration_filepath) # filtration file
-        #TODO: validate the txf file, check if all faces are contained, etc. But validation costs time. do we really need to do that?
-        self.txf_dir = os.path.dirname(self.txf)
-        self.txf_basename_wo_ext = os.path.splitext(os.path.basename(self.txf))[0]
+                        'indexAligner','_dots','_lines','_dots_df','_lines_df','_plot_data','_dec_array','dotdec','plot_dots',\
+                            'deltas','_simplex_ids','dims','diagrams','_checkpoint_dir','_executor','_backend','_deco_state','stats','_reduce_complexes','column_groups','_uncompressed','_extension']
+
+    def __init__(self, filtration_filepath=None,ladder_length=None,homology_dim=None,filtration_values=None,enable_multi_processing:bool=False,num_cores:int=-1,verbose:bool=False,clean_up:bool=True,algorithm_phat:str='chunk_reduction',checkpoint_dir:str=None,executor=None,backend:str='processes',precomputed=None,deferred:bool=False,progress_callback=None,reduce_complexes:bool=False,compress_columns:bool=True,extendable:bool=False,clf:CLFiltration=None,**kwargs ):
+        # filtration_filepath: path to a filtration file
+        # clf: or a CLFiltration, read directly from its simplex trees without writing a file,
+        #   ladder_length and filtration_values are then those of clf unless given
+        if isinstance(filtration_filepath, CLFiltration):
+            raise TypeError("A CLFiltration is passed with the keyword clf, filtration_filepath is the path of a filtration file.")
+        if (filtration_filepath is None) == (clf is None):
+            raise ValueError("Either filtration_filepath or clf shall be given.")
+        if homology_dim is None:
+            raise ValueError("homology_dim is missing.")
+        if clf is not None:
+            self.clf = clf
+            self.txf = self.txf_dir = self.txf_basename_wo_ext = None
+            ladder_length = clf.ladder_length if ladder_length is None else ladder_length
+            filtration_values = clf.horizontal_parameters if filtration_values is None else filtration_values
+        else:
+            if ladder_length is None or filtration_values is None:
+                raise ValueError("ladder_length and filtration_values are needed with a filtration file.")
+            self.clf = None
+            self.txf = os.path.abspath(filtration_filepath) # filtration file
+            #TODO: validate the txf file, check if all faces are contained, etc. But validation costs time. do we really need to do that?
+            self.txf_dir = os.path.dirname(self.txf)
+            self.txf_basename_wo_ext = os.path.splitext(os.path.basename(self.txf))[0]
         self.m = ladder_length # default length is 10
         self.ladder_length = self.m
         self._enable_multi_processing = enable_multi_processing
         self._num_cores = num_cores
         self._algorithm_phat = algorithm_phat
-        # self.clean_up = clean_up # clean up the temporary files
+        self.clean_up = clean_up # clean up the temporary files, i.e. the checkpoint once the run is complete
+        # optional directory where every finished zigzag barcode is saved,
+        # a run restarted with the same input and checkpoint_dir skips the zigzags already done
+        self._checkpoint_dir = checkpoint_dir
+        # optional CLExecutor, a long-lived pool reused across computations,
+        # the zigzags are computed in parallel on it whenever it is given
+        self._executor = executor
+        # 'processes': the zigzags are computed by worker processes attached to a shared memory copy of the deltas
+        # 'threads': by threads of this process reading self.deltas directly, no copy and no pickling,
+        #   but the speedup depends on fzzpy releasing the GIL, see tests/zigzag_gil_benchmark.py
+        if backend not in ('processes', 'threads'):
+            raise ValueError(f"Unknown backend {backend}, use 'processes' or 'threads'.")
+        self._backend = backend
+        # remove the simplices that do not change the homology of the ladder before building the deltas,
+        # the zigzags are shorter and the cPD is the same, see reduction.py
+        self._reduce_complexes = reduce_complexes
         self.n = 2 # two layers by default
         self.dim = homology_dim # homology dimension
+        # homology_dim can also be a list of dimensions, then every zigzag is computed once for all of them,
+        # and self.diagrams maps each dimension to its own ConnectedPersistenceDiagram
+        self.dims = sorted(set(homology_dim)) if isinstance(homology_dim, (list, tuple, set, range)) else [homology_dim]
         self.times = self.preprocess_filtration_values(filtration_values)
+        # wall/cpu time, peak RSS and item counts of each phase, and the time of each zigzag, see PhaseStats
+        self.stats = PhaseStats()
         if verbose:
             logging.basicConfig(level=logging.DEBUG)
-        is_intv_loaded = False
+        # precomputed: the (intv, variables) of load_precomputed, shared by all the diagrams of the same length
+        if precomputed is None:
+            precomputed = self.load_precomputed(self.m, self.n)
+        self.intv, self.variables = precomputed
+        # print("Preloading/precomputing complete!")
+        with self.stats.phase('complexes') as record:
+            self.complexes = self.complexes_generator()
+            record['items'] += len(self.complexes[self.m-1][self.n-1])
+        # extendable: the deltas, the last column and every barcode are kept once the diagram is complete,
+        # so that a column can be appended to the ladder later without starting over, see extend
+        self._extension = None
+        if extendable:
+            self._extension = {'last_column': [set(S) for S in self.complexes[self.m-1]], 'barcodes': {}, 'compress_columns': compress_columns}
+        if reduce_complexes:
+            with self.stats.phase('reduction') as record:
+                record['items'] += reduce_ladder(self.complexes, max(self.dims))
+            logging.debug(f"{record['items']} simplices removed by the reduction")
+        # column_groups[k]: the first and the last original columns of the column k of the ladder computed on,
+        # runs of identical columns are merged when compress_columns is set, see _compress_columns
+        self.column_groups = [(a, a) for a in range(self.m)]
+        self._uncompressed = None
+        if compress_columns:
+            with self.stats.phase('compression') as record:
+                self._compress_columns()
+                record['items'] += self.ladder_length - len(self.column_groups)
+        with self.stats.phase('encoding') as record:
+            self.deltas = self.delta_store_generator()
+            record['items'] += self.deltas.num_simplices
+        del self.complexes, self._simplex_ids
+        if deferred:
+            # the zigzags are computed later, by stream() or by batch_cPD,
+            # which then calls _prepare_deco, _store_barcode and _finish_deco
+            return
+        if progress_callback is not None:
+            # progress_callback(kind, data) is called with every event of stream()
+            for kind, data in self.stream():
+                progress_callback(kind, data)
+            return
+        self._complete(*self.deco())
+
+    def stream(self):
+        """
+        Compute a diagram constructed with deferred=True step by step, a generator of the events (kind, data):
+            ('rows', rows): the barcodes of the rows, rows['upper'][dim] and rows['lower'][dim]
+                are d_ss arrays, d_ss[b,d] is the number of bars [b,d]
+            ('boundary', c_ss): c_ss[dim].lower and c_ss[dim].upper are complete
+            ('pair', ((b0,d1), blocks)): the zigzag of (b0,d1) is done, blocks[dim] is c_ss[dim].pair(b0,d1)
+                for the dimensions where the pair does not vanish,
+                the pairs with the same zigzag sequence come one after the other
+            ('done', self): dec, lines and dots are ready
+        partial_dec() can be called between two events.
+        The columns of rows, c_ss and the pairs are those of the compressed ladder, see column_groups,
+        the ones of partial_dec and of the final diagram are the original columns.
+        Closing the generator stops the computation, the workers are terminated,
+        and the checkpoint, if any, is closed and kept so that a new run resumes from it.
+        """
+        todo_parameters = self._prepare_deco()
+        state = self._deco_state
+        finished = False
+        try:
+            yield 'rows', state['rows']
+            yield 'boundary', state['c_ss']
+            # the time of the consumer between two events is counted in the pairs phase
+            with self.stats.phase('pairs', items=len(todo_parameters)):
+                for (b0, d1), barcode in self._compute_pairs(todo_parameters):
+                    for b0, d1 in self._store_barcode(b0, d1, barcode):
+                        yield 'pair', ((b0, d1), {dim: state['c_ss'][dim].pair(b0, d1) for dim in self.dims if state['non_vanishing'][dim][b0, d1]})
+            finished = True
+        finally:
+            if not finished and state['checkpoint']:
+                # stopped early, the checkpoint is closed but kept, a new run resumes from it
+                state['checkpoint'].close()
+        self._complete(*self._finish_deco())
+        yield 'done', self
+
+    def partial_dec(self, dim=None):
+        """
+        The part of dec that is already final while the diagram is computed by stream(),
+        i.e. the intervals whose Moebius terms are all known, in the format of dec.
+        It grows with every pair, and is dec once the computation is done.
+        """
+        dim = self.dims[0] if dim is None else dim
+        if not hasattr(self, '_deco_state'):
+            if hasattr(self, 'diagrams'):
+                return dict(self.diagrams[dim].dec)
+            return dict(getattr(self, 'dec', {}))
+        c_ss, known = self._deco_state['c_ss'][dim], self._deco_state['known'][dim]
+        if self._uncompressed is not None:
+            # back to the original columns, the known flags go along with the values of c_ss
+            columns = self._original_columns()
+            known_css = DenseCss(self.m)
+            known_css.values[...] = known
+            c_ss, known = c_ss.expand(columns), known_css.expand(columns).values.astype(bool)
+        moebius = self.variables['moebius']
+        delt_ss = moebius.apply(c_ss).tolist()
+        final = moebius.resolved(known).tolist()
+        return {f"{I[0][0]},{I[0][1]},{I[1][0]},{I[1][1]}": mult for I, mult, f in zip(self.intv, delt_ss, final) if f and mult != 0}
+
+    def extend(self, new_column_upper, new_column_lower, filtration_value):
+        """
+        Append a column to the ladder of a complete diagram constructed with extendable=True,
+        the diagram becomes the cPD of CL(m+1), the same as if it were computed from scratch.
+        new_column_upper, new_column_lower: the simplices (lists of vertices) appearing at the new column
+            in the upper and in the lower row, the ones of the lower row appear in the upper row too
+        filtration_value: the filtration value of the new column, larger than the last one
+
+        On CL(m+1), the zigzag of a pair (b0,d1) is its zigzag on CL(m) followed by the new step of the lower row,
+        and the zigzag of a row is followed by the new step of the row.
+        The barcode of a prefix of a zigzag is the restriction of its barcode, only the bars alive at the end
+        can change, and a bar of dimension dim only dies by the insertion of a (dim+1)-simplex.
+        The bars born in the new step are not alive at (d1,1), they do not count for the pair.
+        So the stored barcodes of the pairs are extended without computing anything, except where a bar is alive at the end
+        and the new step has simplices one dimension above: these zigzags are computed again,
+        together with the new pairs (b0,m) and the two rows.
+        Then c_ss and delt_ss are completed as usual, the Moebius inversion is redone.
+        At best the new column costs its m+3 zigzags, at worst (a class alive everywhere killed by the new column)
+        every zigzag is computed again.
+        Returns self.
+        """
+        extension = self._extension
+        if extension is None:
+            raise ValueError("Only a diagram constructed with extendable=True can be extended.")
+        if hasattr(self, '_deco_state') or not (hasattr(self, 'delt_ss') or hasattr(self, 'diagrams')):
+            raise ValueError("The diagram is not complete yet.")
+        if not filtration_value > self.times[-1]:
+            raise ValueError("The filtration values provided are not strictly increasing.")
+        with self.stats.phase('extension') as record:
+            max_dim = max(self.dims)+1
+            simplices = lambda column: {tuple(sorted(simplex)) for simplex in column if len(simplex) <= max_dim+1}
+            last_lower, last_upper = extension['last_column']
+            lower = last_lower | simplices(new_column_lower)
+            upper = last_upper | simplices(new_column_upper) | lower
+            old = self.deltas
+            C = old.complexes()
+            # the ladder computed on, one column for each original column
+            columns = [C[k] for k, (first, last) in enumerate(self.column_groups) for _ in range(first, last+1)]
+            if len(lower) == len(last_lower) and len(upper) == len(last_upper):
+                # nothing new, the last column again, also when it is reduced
+                columns.append(C[-1])
+            else:
+                # the reduced columns are included in the original ones, the new column goes after them
+                columns.append([lower, upper])
+            extension['last_column'] = [lower, upper]
+            self.m = self.ladder_length = self.m+1
+            self.times = np.append(self.times, filtration_value)
+            self.intv, self.variables = self.load_precomputed(self.m, self.n)
+            self.complexes = columns
+            self.column_groups = [(a, a) for a in range(self.m)]
+            if extension['compress_columns']:
+                self._compress_columns()
+            self.deltas = self.delta_store_generator()
+            del self.complexes, self._simplex_ids
+            done = {}
+            for key, barcode in extension['barcodes'].items():
+                barcode = self._extend_barcode(old, key, barcode)
+                if barcode is not None:
+                    done[key] = barcode
+            record['items'] += len(done)
+        logging.debug(f"{len(done)} of {len(extension['barcodes'])} barcodes extended")
+        self._complete(*self.deco(done))
+        return self
+
+    def restrict(self, indices):
+        """
+        The cPD of the ladder made of the columns indices (strictly increasing, from 0) of this one,
+        e.g. the cPD of clf.resample_filtration(len(indices), [i+1 for i in indices]),
+        derived from this complete diagram without computing any zigzag.
+        The zigzag of the pair (b0,d1) of the restricted ladder is a subsequence of the zigzag of
+        (indices[b0],indices[d1]) here, with inclusions in between, so its bars are the restrictions of the bars here:
+        a bar [b,d] becomes [first selected column >= b, last selected column <= d], or vanishes if there is none.
+        So the c_ss of the restricted ladder is mostly c_ss at the selected columns (see DenseCss.restrict),
+        and delt_ss follows by the Moebius inversion.
+        Returns a new ConnectedPersistenceDiagram, this one is left unchanged.
+        """
+        if hasattr(self, '_deco_state') or not (hasattr(self, 'delt_ss') or hasattr(self, 'diagrams')):
+            raise ValueError("The diagram is not complete yet.")
+        indices = [int(i) for i in indices]
+        if not indices or indices[0] < 0 or indices[-1] >= self.m or any(i >= j for i, j in zip(indices, indices[1:])):
+            raise ValueError("The indices must be strictly increasing columns of the ladder.")
+        D = self.__class__.__new__(self.__class__)
+        for attr in ['txf','txf_dir','txf_basename_wo_ext','clf','_enable_multi_processing','_num_cores','_algorithm_phat','n','dim','dims']:
+            setattr(D, attr, getattr(self, attr))
+        D.m = D.ladder_length = len(indices)
+        D.times = self.times[indices]
+        D.column_groups = [(a, a) for a in range(D.m)]
+        D._uncompressed = D._extension = None
+        D.stats = PhaseStats()
+        D.intv, D.variables = self.load_precomputed(D.m, self.n)
+        if self.dims == [self.dim]:
+            c_ss = {self.dim: self.variables['c_ss']}
+        else:
+            c_ss = {dim: self.diagrams[dim].variables['c_ss'] for dim in self.dims}
+        with D.stats.phase('restriction', items=len(D.intv)*len(self.dims)):
+            c_ss = {dim: c_ss[dim].restrict(indices) for dim in self.dims}
+            delt_ss = {dim: dict(zip(D.intv, D.variables['moebius'].apply(c_ss[dim]).tolist())) for dim in self.dims}
+        D._complete(delt_ss, c_ss)
+        return D
+
+    def _extend_barcode(self, old, key, barcode):
+        """
+        The barcode of the zigzag of key, a pair (b0,d1) or a row, on the ladder self.deltas,
+        from its barcode on the ladder old, of which self.deltas is an extension,
+        or None when it has to be computed again, see extend.
+        Only the bars used in the c_ss of the pair are kept, those of the dimensions in self.dims born before the new step.
+        """
+        new = self.deltas
+        if key[0] == -1:
+            b = key[1]
+            if new.length(0, b, new.m-1, b) != old.length(0, b, old.m-1, b):
+                # the bars born in the new step are part of the barcode of a row
+                return None
+            return barcode
+        length, new_length = old.pair_length(*key), new.pair_length(*key)
+        if length == new_length:
+            return barcode
+        # the bars alive at the end, and the dimensions of the simplices appended to the zigzag
+        barcode = barcode[np.isin(barcode[:, 0], self.dims)]
+        alive = barcode[:, 2] == length
+        step = new.segments(old.m-1, 0, new.m-1, 0)[0][0]
+        step_dims = set((np.searchsorted(new.dim_offsets, step, side='right')-1).tolist())
+        if any(dim+1 in step_dims and (alive & (barcode[:, 0] == dim)).any() for dim in self.dims):
+            return None
+        barcode = barcode.copy()
+        barcode[alive, 2] = new_length
+        return barcode
+
+    @staticmethod
+    def load_precomputed(m, n=2):
+        """
+        The intervals and the variables ('cov', 'c_ss', 'moebius') of the ladder of length m,
+        read-only and cached in the process, see precomputed_tables.
+        """
+        return precomputed_tables(m, n)
+
+    @staticmethod
+    def _read_precomputed(m, n):
+        """
+        The intervals and the variables of the ladder of length m,
+        loaded from PRECOMPUTED_INTV_DIR if available, computed otherwise.
+        The binary store (see CommutativeGridPreCompute.save_binary) is preferred over the pickle files,
+        it is memory-mapped, so it opens in constant time and its pages are shared by all the processes.
+        """
         if PRECOMPUTED_INTV_DIR:
-            intv_fn=f"{PRECOMPUTED_INTV_DIR}/intv_{self.m:03d}_{self.n:03d}.pkl"
-            variables_fn=f"{PRECOMPUTED_INTV_DIR}/variables_{self.m:03d}_{self.n:03d}.pkl"
+            precomputed = load_precomputed_binary(PRECOMPUTED_INTV_DIR, m, n)
+            if precomputed is not None:
+                print("Loading precomputed binary tables...")
+                return precomputed
+            intv_fn=f"{PRECOMPUTED_INTV_DIR}/intv_{m:03d}_{n:03d}.pkl"
+            variables_fn=f"{PRECOMPUTED_INTV_DIR}/variables_{m:03d}_{n:03d}.pkl"
             if os.path.exists(intv_fn) and os.path.exists(variables_fn):
                 print("Loading precomputed intervals and variables...")
                 with open(intv_fn,"rb") as f:
-                    self.intv = pickle.load(f)
+                    intv = pickle.load(f)
                 with open(variables_fn,"rb") as f:
-                    self.variables = pickle.load(f) # get 'cov' and 'c_ss'
-                is_intv_loaded = True
+                    variables = pickle.load(f) # get 'cov' and 'c_ss'
                 logging.debug("Preloading complete!")
-        if not is_intv_loaded:
-            temp = CommutativeGridPreCompute(self.m,self.n)
-            self.intv = temp.get_intervals()
-            self.variables = temp.get_variables() # get 'cov' and 'c_ss'
-            del temp
-        # print("Preloading/precomputing complete!")
-        self.complexes = self.complexes_generator()
-        self.NodeToStr = self.node2str_generator()    
-        self.PathToStr = self.path2str_generator()
-        del self.complexes
-        self.delt_ss = self.deco()
-        self.compute_dec_obj()
-        self.compute_connecting_lines()
-        self.compute_dotdec()
-        self.compute_plot_dots()
+                if not isinstance(variables['c_ss'], DenseCss):
+                    # c_ss of older precomputed files is a dict of zeros, use the dense arrays instead
+                    variables['c_ss'] = DenseCss(m)
+                if 'moebius' not in variables:
+                    # older precomputed files come without the Moebius table
+                    variables['moebius'] = MoebiusTable.from_covers(intv, variables['cov'], m)
+                return intv, variables
+        temp = CommutativeGridPreCompute(m,n)
+        return temp.get_intervals(), temp.get_variables() # get 'cov' and 'c_ss'
+
+    def _compress_columns(self):
+        """
+        Merge the runs of consecutive columns where neither row gains a simplex,
+        the zigzags are computed on the shorter ladder.
+        The pairs of columns of a run all give the same zigzag module up to repeated identities,
+        so c_ss is expanded back to the original columns in _finish_deco, see DenseCss.expand,
+        and only the tables of the original length are used, those of the shorter ladder are never loaded.
+        """
+        C = self.complexes
+        # the complexes only grow along a row, a column is the same as the previous one iff it is as large
+        starts = [0] + [a for a in range(1, self.m) if any(len(C[a][b]) != len(C[a-1][b]) for b in range(self.n))]
+        if len(starts) == self.m:
+            return
+        self.column_groups = list(zip(starts, [a-1 for a in starts[1:]] + [self.m-1]))
+        self._uncompressed = self.m # the original length, self.intv and self.variables stay those of it
+        self.complexes = [C[a] for a in starts]
+        self.m = len(starts)
+        logging.debug(f"{self._uncompressed} columns merged into {self.m}")
+
+    def _original_columns(self):
+        """the column of the compressed ladder of each original column"""
+        return np.repeat(np.arange(self.m), [last-first+1 for first, last in self.column_groups])
+
+    def _complete(self, delt_ss, c_ss):
+        """the decomposition and the plot data, from the output of deco()"""
+        with self.stats.phase('output') as record:
+            if self.dims == [self.dim]:
+                self.delt_ss = delt_ss[self.dim]
+                # the shared variables are left untouched, this diagram keeps its own c_ss
+                self.variables = dict(self.variables, c_ss=c_ss[self.dim])
+                self.compute_dec_obj()
+                self.compute_connecting_lines()
+                self.compute_dotdec()
+                self.compute_plot_dots()
+                record['items'] += len(self.dec)
+            else:
+                self.diagrams = {dim: self._diagram_of_dim(dim, delt_ss[dim], c_ss[dim]) for dim in self.dims}
+                record['items'] += sum(len(D.dec) for D in self.diagrams.values())
+
+    def _diagram_of_dim(self, dim, delt_ss, c_ss):
+        """the ConnectedPersistenceDiagram of one dimension in the multi-dimension mode"""
+        D = self.__class__.__new__(self.__class__)
+        for attr in ['txf','txf_dir','txf_basename_wo_ext','clf','m','ladder_length',\
+                     '_enable_multi_processing','_num_cores','_algorithm_phat','n','times','intv','stats','column_groups']:
+            setattr(D, attr, getattr(self, attr))
+        D.dim = dim
+        D.dims = [dim]
+        D.variables = dict(self.variables, c_ss=c_ss)
+        D.delt_ss = delt_ss
+        D.compute_dec_obj()
+        D.compute_connecting_lines()
+        D.compute_dotdec()
+        D.compute_plot_dots()
+        return D
 
 
     # def __del__(self):
@@ -110,38 +449,48 @@ def preprocess_filtration_values(self,filtration_values):
             raise ValueError("The filtration values provided are not strictly increasing.")
         return np.asarray(filtration_values)
 
+    def _check_single_dimension(self, name):
+        """the plot data are those of one dimension, in the multi-dimension mode they are in diagrams[dim]"""
+        if self.dims != [self.dim]:
+            raise ValueError(f"{name} is computed for each dimension when homology_dim is a list, use diagrams[dim].{name}.")
+
     @property
     def plot_data(self):
-        plot_data_dict = {}
-        plot_data_dict.update({'ladder_length': self.ladder_length})
-        plot_data_dict.update({'dim': self.dim})
-        plot_data_dict.update({'radii': self.times})
-        plot_data_dict.update({'dots': self.dots.to_csv(index=True)})
-        plot_data_dict.update({'lines': self.lines.to_csv(index=True)})
-        return plot_data_dict
+        self._check_single_dimension('plot_data')
+        # the csv texts are formatted once, on the first access
+        if getattr(self, '_plot_data', None) is None:
+            plot_data_dict = {}
+            plot_data_dict.update({'ladder_length': self.ladder_length})
+            plot_data_dict.update({'dim': self.dim})
+            plot_data_dict.update({'radii': self.times})
+            plot_data_dict.update({'dots': self.dots.to_csv(index=True)})
+            plot_data_dict.update({'lines': self.lines.to_csv(index=True)})
+            self._plot_data = plot_data_dict
+        return dict(self._plot_data)
+
+    @property
+    def dots(self):
+        """the dots as a DataFrame, built from the record array self._dots on the first access"""
+        self._check_single_dimension('dots')
+        if getattr(self, '_dots_df', None) is None:
+            self._dots_df = pd.DataFrame(self._dots).astype({'area': object})
+        return self._dots_df
+
+    @property
+    def lines(self):
+        """the connecting lines as a DataFrame, built from the record array self._lines on the first access"""
+        self._check_single_dimension('lines')
+        if getattr(self, '_lines_df', None) is None:
+            self._lines_df = pd.DataFrame(self._lines)
+        return self._lines_df
 
 
-    #@staticmethod
-    @lru_cache(maxsize=4096)
     def join_intv(self, X, Y):
         """
         helper function to join two intervals
         works for 2D commutative grid
         """
-        n = self.n # number of layers (rows), will be two for commutative ladders
-        # n will be the length of both X and Y 
-        Z = list(X)
-        for j in range(n):
-            Z[j] = (min(X[j][0], Y[j][0]), max(X[j][1], Y[j][1]))
-        for s in range(n):
-            if Z[s][1] > -1: break
-        for t in range(n-1, -1, -1):
-            if Z[t][1] > -1: break
-        if s < t and Z[s][1] < Z[s+1][1]:
-            Z[s] = (Z[s][0], Z[s][1]+1)
-        if s < t and Z[t][0] > Z[t-1][0]:
-            Z[t] = (Z[t][0]-1, Z[t][1])
-        return tuple(Z)
+        return join_intv(X, Y, self.n)
     
     @timeit
     def complexes_generator(self):
@@ -151,36 +500,79 @@ def complexes_generator(self):
         # j: layer index
         C = [[set() for j in range(self.n)] for i in range(self.m)]
         # C is a list of lists of sets, 
-        # each set contains strings of vertices, 
-        # each string represents a simplex
-        with open(self.txf, 'r') as f:
-            filt = [line.rstrip() for line in f]
-            # line is in form of
-            # dim birth n m v_0...v_dim
-            # filt=f.read().rstrip().split('\n') #filtration
-        if filt[0] == '':
-            return
-        for i in range(len(filt)):
-            data=filt[i].rstrip().split()
-            # data = filt[i].split()
-            if data[0] == '#': continue # skip comments
-            if self.dim + 1 < int(data[0]): continue # skip higher dimensions
-            cur_time = float(data[1])
-            y_index = int(data[2])
-            # x_index should be determined by cur_time and self.times
-            x_index = bisect_left(self.times, cur_time)
-            if x_index == len(self.times): #skip if cur_time is larger than the largest time in the filtration
-                break
-            # data[3]: horizontal index
-            # data[2]: vertical index
-            # C[x_index][y_index].add(' '.join(sorted(data[4:])))
-            # check if sorted here is sufficient, or if it is necessary to sort
-            # I believe that it works well as long as it is sorted, no matter the order'
-            # maybe better to change it to the one below
-            # breakpoint()
-            C[x_index][y_index].add(' '.join(sorted(data[4:], key=lambda x: (len(x), x))))
-            # C[x_index][y_index].add(tuple(sorted(map(int, data[4:])))) # sort the representation for a single simplex to be added 
-            # using integers too slow
+        # each set contains tuples of vertices, 
+        # each tuple represents a simplex
+        if self.clf is not None:
+            self._fill_complexes_from_clfiltration(C)
+            return self._complexes_reconstruction(C)
+        # line is in form of
+        # dim birth n m v_0...v_dim
+        # data[3]: horizontal index
+        # data[2]: vertical index
+        for x_index, y_index, vertices in self.read_filtration_file(self.txf, max(self.dims)+1, self.times):
+            # group the simplices by node (x_index,y_index), vertices are already sorted in each row
+            order = np.lexsort((y_index, x_index))
+            x_index, y_index, vertices = x_index[order], y_index[order], vertices[order]
+            starts = np.flatnonzero(np.diff(x_index*self.n+y_index, prepend=-1))
+            ends = np.append(starts[1:], len(order))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                C[x_index[start]][y_index[start]].update(map(tuple, vertices[start:end].tolist()))
+        return self._complexes_reconstruction(C)
+
+    @staticmethod
+    def read_filtration_file(filepath, max_dim, times, chunk_rows=1<<20):
+        """
+        Parse a filtration file in the format dim birth n m v_0 .. v_dim (CECH_RANDOM)
+        with the C tokenizer of pandas, chunk_rows lines at a time so that the memory stays bounded.
+        Only the first max_dim+5 fields are kept, lines of simplices above max_dim are
+        truncated or skipped by the tokenizer and then dropped by their dimension.
+        Yields (x_index, y_index, vertices) arrays for each chunk and each dimension <= max_dim,
+            x_index: the column, searchsorted against times
+            y_index: the row, 0 for lower and 1 for upper
+            vertices: one simplex per row, sorted
+        As the file is ordered by birth, parsing stops at the first simplex (of dimension <= max_dim)
+        born after the last time.
+        """
+        import warnings
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', pd.errors.ParserWarning) # about the truncated lines
+            try:
+                chunks = pd.read_csv(filepath, sep=r'\s+', header=None, names=range(max_dim+5), index_col=False,
+                                     comment='#', dtype={1: np.float64}, on_bad_lines='skip', chunksize=chunk_rows)
+                for chunk in chunks:
+                    dims = chunk[0].to_numpy(dtype=np.int64)
+                    x_index = np.searchsorted(times, chunk[1].to_numpy(), side='left')
+                    y_index = chunk[2].to_numpy(dtype=np.int64)
+                    kept = dims <= max_dim
+                    too_late = np.flatnonzero(kept & (x_index == len(times)))
+                    if len(too_late):
+                        kept[too_late[0]:] = False
+                    for dim in np.unique(dims[kept]).tolist():
+                        rows = np.flatnonzero(kept & (dims == dim))
+                        vertices = chunk.iloc[rows, 4:dim+5].to_numpy(dtype=np.int64)
+                        vertices.sort(axis=1)
+                        yield x_index[rows], y_index[rows], vertices
+                    if len(too_late):
+                        return
+            except pd.errors.EmptyDataError: # no simplex in the file
+                return
+
+    def _fill_complexes_from_clfiltration(self, C):
+        """
+        C[x][y] gets the simplices of the CLFiltration appearing at the column x in the row y,
+        same as reading its random_cech_format_output_file
+        """
+        h_params = self.clf.horizontal_parameters
+        for y_index, tree in enumerate([self.clf.lower, self.clf.upper]):
+            for simplex, fv in tree.get_filtration():
+                if max(self.dims) + 1 < len(simplex)-1: continue # skip higher dimensions
+                ordinal = round(fv) # filtration values of a CLFiltration are 1,2,...,ladder_length
+                if ordinal > len(h_params): continue
+                x_index = bisect_left(self.times, h_params[ordinal-1])
+                if x_index == len(self.times): continue # larger than the largest time in the filtration
+                C[x_index][y_index].add(tuple(sorted(simplex)))
+
+    def _complexes_reconstruction(self, C):
         # up to now, C contains each simplices newly added at each step.
         for i in range(1, self.m): # Reconstruct the lower layer
             C[i][0] = C[i][0] | C[i-1][0] # union
@@ -194,210 +586,145 @@ def complexes_generator(self):
         return C
 
     @timeit
-    def node2str_generator(self):
-        NodeToStr={} #Dictionary to store string representations of nodes
-        # NodeToStr = CompressedDict()
-        # format for each value: simplex, length of simplex (i.e., number of vertices)
-        m=self.m
-        n=self.n
-        s=''
-        #raise error if self.complexes is not defined
+    def simplex_index_generator(self):
+        """
+        Assign a global integer ID to each simplex, once.
+        IDs follow the order (number of vertices, vertices),
+        so sorting a list of IDs gives the insertion order used by fzz.
+        Returns the list of simplices, indexed by their IDs.
+        """
         if not hasattr(self, 'complexes'):
             raise AttributeError("self.complexes is not defined. Please run self.complexes_generator() first.")       
-        C=self.complexes
-        for a in range(m):
-            for b in range(n):
-                L=list(C[a][b])
-                # if len(L)==0: #TODO: check correctness
-                #     NodeToStr[(a, b)]=('', 0)
-                #     continue
-                L.sort(key=lambda x: (len(x.split(' ')),tuple(map(int,x.split(' ')))))  
-                # s='\ni '.join(L) 
-                # NodeToStr[(a, b)]=('i '+s+'\n', len(L))
-                # L=list(C[a][b]) # a set of tuples, representing a simplicial complex, inherently not sorted in python
-                # L.sort(key=lambda x: (len(x), x)) # sort by length first, then by the tuple itself
-                # L = list(map(lambda x: ' '.join(map(str, x)), L)) # convert each tuple to a string
-                if len(L)==0:
-                    NodeToStr[(a, b)]=('', 0)
-                    continue
-                # map_obj=[map(str, tup) for tup in L] #too slow
-                # str_rep = '\n'.join([f"i {' '.join(simplex)}" for simplex in map_obj]) #too slow
-                str_rep = '\n'.join([f"i {simplex}" for simplex in L])
-                NodeToStr[(a, b)]=(str_rep, len(L))
-        if isinstance(NodeToStr, dict):
-            NodeToStr = CompressedDict(NodeToStr)
-        if self._enable_multi_processing:
-            from commutazzio.utils import CompressedDictManager
-            manager = CompressedDictManager()
-            manager.start()
-            return manager.CompressedDict(CompressedDict(NodeToStr))
-            # from multiprocessing import Manager
-            # # return Manager().dict(NodeToStr)
-            # # return NodeToStr
-            # return Manager().dict(CompressedDict(NodeToStr))
-        else:
-            return NodeToStr
-        
+        # the upper right node contains every simplex of the ladder
+        simplices = sorted(self.complexes[self.m-1][self.n-1], key=lambda x: (len(x), x))
+        self._simplex_ids = {simplex: i for i, simplex in enumerate(simplices)}
+        return [list(simplex) for simplex in simplices]
+
+    def _delta(self, simplex_set):
+        """
+        Encode a set of simplices as an int32 array of simplex IDs,
+        sorted in the insertion order.
+        """
+        ids = np.fromiter((self._simplex_ids[s] for s in simplex_set), dtype=np.int32, count=len(simplex_set))
+        ids.sort()
+        return ids
+
     @timeit
-    def path2str_generator(self):
-        def _path_join(path1,path2):
-            str1,l1=path1
-            str2,l2=path2
-            if l1==0: return path2
-            if l2==0: return path1
-            return ('\n'.join([str1,str2]),l1+l2)
-        PathToStr=CompressedDict() #Compressed Dictionary to store string representations of paths 
-        # Starting from CompressedDict instead of copying from dict to reduce memory usage
-        # PathToStr={}
+    def delta_store_generator(self):
+        """
+        Store the single-step deltas of the ladder,
+        paths are composed on demand by LadderDeltaStore
+        """
         m=self.m
         n=self.n
-        # s=''        
         if not hasattr(self, 'complexes'):
             raise AttributeError("self.complexes is not defined. Please run self.complexes_generator() first.")       
-        C=self.complexes # C is a list of lists of sets, each set contains strings of vertices, each string represents a simplex
-        for a in range(m):
-            L=list(C[a][1]-C[a][0]); 
-            # L.sort(key=lambda x: (len(x), x))
-            # L = list(map(lambda x: ' '.join(map(str, x)), L)) # convert each tuple to a string
-            L.sort(key=lambda x: (len(x.split(' ')),tuple(map(int,x.split(' ')))))  
-            if len(L) == 0: 
-                PathToStr[(a, 0, a, 1)]=('', 0)
-                PathToStr[(a, 1, a, 0)]=('', 0)
-                continue
-            # map_obj=[map(str, tup) for tup in L]
-            # str_rep = '\n'.join([f"i {' '.join(simplex)}" for simplex in map_obj])
-            str_rep = '\n'.join([f"i {simplex}" for simplex in L])
-            PathToStr[(a, 0, a, 1)]=(str_rep, len(L))
-            # map_obj_rev=[map(str, tup) for tup in reversed(L)]
-            # str_rep_rev = '\n'.join([f"d {' '.join(simplex)}" for simplex in map_obj_rev])
-            str_rep_rev = '\n'.join([f"d {simplex}" for simplex in reversed(L)])
-            PathToStr[(a, 1, a, 0)]=(str_rep_rev, len(L))
-        
-        for a in range(m-1):
-            for b in range(n):
-                L=list(C[a+1][b]-C[a][b]); 
-                # L.sort(key=lambda x: (len(x), x))
-                # L = list(map(lambda x: ' '.join(map(str, x)), L)) # convert each tuple to a string
-                L.sort(key=lambda x: (len(x.split(' ')),tuple(map(int,x.split(' ')))))
-                if len(L) == 0: 
-                    PathToStr[(a, b, a+1, b)]=('', 0)
-                    PathToStr[(a+1, b, a, b)]=('', 0)
-                    continue
-                # map_obj=[map(str, tup) for tup in L]
-                # str_rep = '\n'.join([f"i {' '.join(simplex)}" for simplex in map_obj])
-                str_rep = '\n'.join([f"i {simplex}" for simplex in L])
-                PathToStr[(a, b, a+1, b)]=(str_rep, len(L))
-                # map_obj_rev=[map(str, tup) for tup in reversed(L)]
-                # str_rep_rev = '\n'.join([f"d {' '.join(simplex)}" for simplex in map_obj_rev]) 
-                str_rep_rev = '\n'.join([f"d {simplex}" for simplex in reversed(L)])
-                PathToStr[(a+1, b, a, b)]=(str_rep_rev, len(L))
-            PathToStr[(a, 0, a+1, 1)]=_path_join(PathToStr[(a, 0, a+1, 0)], PathToStr[(a+1, 0, a+1, 1)])
-            PathToStr[(a+1, 1, a, 0)]=_path_join(PathToStr[(a+1, 1, a, 1)], PathToStr[(a, 1, a, 0)])
-        
-        for l in range(2, m):
-            a=0
-            while a+l<m:
-                for b in range(n):
-                    PathToStr[(a, b, a+l, b)]=_path_join(PathToStr[(a, b, a+l-1, b)], PathToStr[(a+l-1, b, a+l, b)])
-                    PathToStr[(a+l, b, a, b)]=_path_join(PathToStr[(a+l, b, a+1, b)], PathToStr[(a+1, b, a, b)])
-                PathToStr[(a, 0, a+l, 1)]=_path_join(PathToStr[(a, 0, a+l, 0)], PathToStr[(a+l, 0, a+l, 1)])
-                PathToStr[(a+l, 1, a, 0)]=_path_join(PathToStr[(a+l, 1, a, 1)], PathToStr[(a, 1, a, 0)])
-                a+=1
-        #get memory usage
-        # from ..utils import print_memory_usage
-        # print_memory_usage(PathToStr)
-        # logging.debug("PathToStr dict object generated.")
-        if isinstance(PathToStr, dict):
-            PathToStr = CompressedDict(PathToStr)
-        if self._enable_multi_processing:
-            from commutazzio.utils import CompressedDictManager
-            manager = CompressedDictManager()
-            manager.start()
-            return manager.CompressedDict(PathToStr)
-        else:
-            return PathToStr
-
-    @staticmethod
-    def _data_source_to_filts(data_source):
-        filt_simps = []
-        filt_ops = []
-        for data in data_source: # each data represents a path
-            lines = data.strip().split("\n")
-            for line in lines:
-                if line: # can encounter '', which means no change in the filtration, does not affect the indexAligner
-                    parts = line.split()
-                    op = parts[0]
-                    simp = list(map(int, parts[1:]))
-                    filt_simps.append(simp)
-                    if op == "i":
-                        filt_ops.append(True)
-                    elif op == "d":
-                        filt_ops.append(False)
-        return filt_simps, filt_ops
+        simplices = self.simplex_index_generator()
+        C=self.complexes # C is a list of lists of sets, each set contains tuples of vertices, each tuple represents a simplex
+        nodes = [self._delta(C[0][b]) for b in range(n)]
+        steps = [[self._delta(C[a+1][b]-C[a][b]) for a in range(m-1)] for b in range(n)]
+        verticals = [self._delta(C[a][1]-C[a][0]) for a in range(m)]
+        return LadderDeltaStore(nodes, steps, verticals, simplices)
 
     @timeit
     def fzz_barcode_compute_upper(self):
-        from fzzpy import compute as zz_compute
-        zz_compute = partial(zz_compute, algorithm=self._algorithm_phat)
-
-        # upper layer
-        m=self.m
-        # n=self.n
-        # Consolidate data source
-        data_source = [
-            self.NodeToStr[(0, 1)][0],
-            self.PathToStr[(0, 1, m-1, 1)][0]
-        ]
-        filt_simps, filt_ops = self._data_source_to_filts(data_source)
-        # write data_source to file with random filename 
-        # from uuid import uuid4
-        # filename = uuid4().hex[-6:]
-        # with open(f"data_source_{filename}.txt", 'w') as file:
-        #     for data in data_source:
-        #         file.write(data)
-        # print("Writing data sources to file complete.")
-        del data_source
         logging.debug("Computing upper layer barcode...")
-        barcode = zz_compute(filt_simps,filt_ops)
-        del filt_simps, filt_ops
-        return barcode
+        return self.fzz_compute_row(self.deltas, 1, self._algorithm_phat)
     
     def fzz_barcode_compute_lower(self):
-        from fzzpy import compute as zz_compute
-        zz_compute = partial(zz_compute, algorithm=self._algorithm_phat)
-        # lower layer
-        m=self.m
-        # n=self.n
-        filt_simps = []
-        filt_ops = []
-        # Consolidate data sources
-        data_source = [
-            self.NodeToStr[(0, 0)][0],
-            self.PathToStr[(0, 0, m-1, 0)][0]
-        ]
-        filt_simps, filt_ops = self._data_source_to_filts(data_source)
-        del data_source
-        barcode = zz_compute(filt_simps,filt_ops)
-        del filt_simps, filt_ops
-        return barcode
+        return self.fzz_compute_row(self.deltas, 0, self._algorithm_phat)
     
     @staticmethod
-    def fzz_compute_inside_loop_local_mp(args):
-        b0, d1,m, NodeToStr, PathToStr,algorithm_phat  = args
+    def _attach_worker_deltas(handle):
+        """
+        Attach the worker to the shared delta store of handle, without copying.
+        A worker may serve several diagrams (see CLExecutor),
+        the store of the previous one is released when the next one comes.
+        """
+        global _worker_deltas
+        if _worker_deltas is not None and _worker_deltas._shm.name == handle[0]:
+            return
+        ConnectedPersistenceDiagram._detach_worker_deltas()
+        _worker_deltas = LadderDeltaStore.attach(handle)
+
+    @staticmethod
+    def _detach_worker_deltas(name=None):
+        """
+        Release the delta store attached by the worker, if it is on the block name (any block when None).
+        Run on every worker by CLExecutor.broadcast at the end of a diagram,
+        so that the unlinked block is freed without waiting for the next diagram.
+        """
+        global _worker_deltas
+        if _worker_deltas is None or (name is not None and _worker_deltas._shm.name != name):
+            return
+        _worker_deltas.detach()
+        _worker_deltas = None
+
+    @staticmethod
+    def fzz_compute_pair(deltas, b0, d1, algorithm_phat):
+        """the zigzag barcode of the pair (b0,d1), read from the delta store deltas"""
         from fzzpy import compute as zz_compute
-        zz_compute = partial(zz_compute, algorithm=algorithm_phat)
-        # Generate data directly
-        data_source = [NodeToStr[(0, 1)][0]]
-        if 0 < d1:
-            data_source.append(PathToStr[(0, 1, d1, 1)][0])
-        data_source.append(PathToStr[(d1, 1, b0, 0)][0])
-        if b0 < m-1:
-            data_source.append(PathToStr[(b0, 0, m-1, 0)][0])
-        # Parse the data source directly to generate filt_simp and filt_op
-        filt_simps, filt_ops = ConnectedPersistenceDiagram._data_source_to_filts(data_source)
+        segments = deltas.pair_segments(b0, d1)
+        filt_simps, filt_ops = deltas.to_filts(segments)
+        del segments
         # Compute using the directly generated data
-        barcode = zz_compute(filt_simps, filt_ops)
-        return barcode
+        return zz_compute(filt_simps, filt_ops, algorithm=algorithm_phat)
+
+    @staticmethod
+    def fzz_compute_row(deltas, row, algorithm_phat):
+        """the zigzag barcode of the lower (row=0) or upper (row=1) row"""
+        from fzzpy import compute as zz_compute
+        segments = deltas.node(0, row) + deltas.segments(0, row, deltas.m-1, row)
+        filt_simps, filt_ops = deltas.to_filts(segments)
+        del segments
+        return zz_compute(filt_simps, filt_ops, algorithm=algorithm_phat)
+
+    @staticmethod
+    def fzz_compute_job(deltas, b0, d1, algorithm_phat):
+        """the barcode of the job (b0,d1), where (-1,row) are the rows as in BarcodeCheckpoint"""
+        if b0 == -1:
+            return ConnectedPersistenceDiagram.fzz_compute_row(deltas, d1, algorithm_phat)
+        return ConnectedPersistenceDiagram.fzz_compute_pair(deltas, b0, d1, algorithm_phat)
+
+    @staticmethod
+    def fzz_timed_job(deltas, b0, d1, algorithm_phat):
+        """((b0,d1), barcode, seconds) of the job (b0,d1), the time is reported in stats.pairs"""
+        start = time.perf_counter()
+        barcode = ConnectedPersistenceDiagram.fzz_compute_job(deltas, b0, d1, algorithm_phat)
+        return (b0, d1), barcode, time.perf_counter() - start
+
+    @staticmethod
+    def fzz_compute_batch_mp(handle_and_batch):
+        """
+        compute a batch of jobs on the shared delta store of handle,
+        results are returned as ((b0,d1), barcode, seconds), see fzz_timed_job
+        """
+        handle, batch = handle_and_batch
+        ConnectedPersistenceDiagram._attach_worker_deltas(handle)
+        return [ConnectedPersistenceDiagram.fzz_timed_job(_worker_deltas, *args) for args in batch]
+
+    @staticmethod
+    def schedule_jobs(jobs, costs, num_workers, batches_per_worker=4):
+        """
+        Group the jobs into batches, longest jobs first.
+        The cost of a job is estimated by the length of its zigzag sequence.
+        A batch is closed once its cost reaches total_cost/(batches_per_worker*num_workers),
+        so the expensive jobs are dispatched alone at the beginning
+        and the cheap ones are grouped together at the end, which keeps the tail short.
+        """
+        order = sorted(range(len(jobs)), key=lambda i: costs[i], reverse=True)
+        target = sum(costs) / max(1, batches_per_worker*num_workers)
+        batches = []
+        batch, batch_cost = [], 0
+        for i in order:
+            batch.append(jobs[i])
+            batch_cost += costs[i]
+            if batch_cost >= target:
+                batches.append(batch)
+                batch, batch_cost = [], 0
+        if batch:
+            batches.append(batch)
+        return batches
 
     @staticmethod
     def write_list_of_lists_of_sets_to_file(file_path, list_of_lists_of_sets):
@@ -411,32 +738,60 @@ def write_list_of_lists_of_sets_to_file(file_path, list_of_lists_of_sets):
                         file.write(f"{sorted_set}, ")
 
     @staticmethod
-    def write_node_to_str(NodeToStr, file_path):
-        # self.write_node_to_str(self.NodeToStr, "NodeToStr.txt")
-        # self.write_node_to_str(self.NodeToStr, "NodeToStr.txt")
+    def write_node_to_delta(deltas, file_path):
+        # self.write_node_to_delta(self.deltas, "NodeToDelta.txt")
         with open(file_path, 'w') as file:
-            for key, value in NodeToStr.items():
-                file.write(f"{key}: {value[0]}")
+            for a in range(deltas.m):
+                for b in range(deltas.n):
+                    ids, ops = deltas.join(deltas.node(a, b))
+                    file.write(f"{(a, b)}: {[deltas.simplex(i) for i in ids]}\n")
+
+    @staticmethod
+    def _barcode_array(barcode, dim):
+        """the bars (p,q) of dimension dim as two int64 arrays"""
+        bars = np.asarray(barcode, dtype=np.int64).reshape(-1, 3)
+        bars = bars[bars[:, 0] == dim]
+        return bars[:, 1], bars[:, 2]
 
-    def _barcode_info_transform_ul(self, barcode):
+    def _barcode_info_transform_ul(self, barcode, dim):
         # for the upper and lower layer
+        # b is the column j with indexAligner[j]<p<=indexAligner[j+1]
+        # d is the column j with indexAligner[j+1]<=q<indexAligner[j+2]
         m=self.m
-        dim=self.dim
-        for interval in barcode:
-            current_dim, p, q = interval #map(int, interval.rstrip().split())
-            if current_dim != dim:
-                continue
-            for j in range(m): 
-                if self.indexAligner[j]<p and p<=self.indexAligner[j+1]: 
-                    b=j; 
-                    break
-            for j in range(-1,m): 
-                if self.indexAligner[j+1]<=q and q<self.indexAligner[j+2]: 
-                    d=j; 
-                    break
-            if b<=d: 
-                self.d_ss[(b, d)]+=1
+        A=self.indexAligner
+        p, q = self._barcode_array(barcode, dim)
+        b = np.searchsorted(A[:m+1], p, side='left')-1
+        d = np.searchsorted(A, q, side='right')-2
+        keep = b<=d
+        # dense count matrix, d_ss[b,d] is the number of bars [b,d]
+        return np.bincount(b[keep]*m+d[keep], minlength=m*m).reshape(m, m)
+
+    def _barcode_info_transform_pair(self, barcode, b0, d1, dim):
+        # for the zigzag (0,1) -> (d1,1) -> (b0,0) -> (m-1,0) of the pair (b0,d1)
+        # only the bars alive at both (d1,1) and (b0,0) are counted
+        # b1 is the column j<=d1 with indexAligner[j]<p<=indexAligner[j+1]
+        # d0 is the column j>=b0 with indexAligner[d1+2+j-b0]<=q<indexAligner[d1+3+j-b0]
+        m=self.m
+        A=self.indexAligner
+        p, q = self._barcode_array(barcode, dim)
+        keep = (p<=A[d1+1]) & (q>=A[d1+2])
+        p, q = p[keep], q[keep]
+        b1 = np.searchsorted(A[:d1+2], p, side='left')-1
+        d0 = np.searchsorted(A, q, side='right')-3-d1+b0
+        keep = b1<=d0
+        # dense count matrix, d_ss[b1,d0] is the number of bars ((b0,d0),(b1,d1))
+        return np.bincount(b1[keep]*m+d0[keep], minlength=m*m).reshape(m, m)
 
+    @staticmethod
+    def _index_aligner(lengths):
+        """
+        indexAligner as an int64 array: 0, then the positions in the zigzag sequence
+        after each node of the ladder, closed by one more position
+        """
+        A = np.zeros(len(lengths)+2, dtype=np.int64)
+        np.cumsum(lengths, out=A[1:-1])
+        A[-1] = A[-2]+1
+        return A
 
     def logging_memory_usage_of_attributes(obj):
         """
@@ -456,117 +811,38 @@ def logging_memory_usage_of_attributes(obj):
                 logging.debug(f"Memory usage of attribute '{slot}': {memory_usage:.2f} MB")
 
     @timeit
-    def deco(self):
+    def deco(self, done=None):
         #deco for decomposition
         #n = self.n
-        m = self.m
-        dim = self.dim
-        # print("全ての道の差分リストを構築")
-        print("Building the difference list of all paths...")
-        self.d_ss = {}
-        # self.indexAligner is used to align the index in the commutative ladder
-        # with the index when all simplicial complex get expanded and inserted one by one
-        # and then computed using fzz
-        self.indexAligner = [0, self.NodeToStr[(0, 1)][1]] 
-        # (0,1), notice the difference
-        for i in range(m-1): 
-            self.indexAligner.append(self.indexAligner[-1]+self.PathToStr[(i, 1, i+1, 1)][1])
-            # ic(i,self.indexAligner)
-        self.indexAligner.append(self.indexAligner[-1]+1)
-        # ic(self.indexAligner)
-        for i in range(m):
-            for j in range(i, m): 
-                self.d_ss[(i, j)]=0
-        print("Difference list building complete.")
+        # returns delt_ss and c_ss of each dimension in self.dims, as dicts
+        # in three parts, so that batch_cPD and stream can compute the zigzags in their own way:
+        # _prepare_deco (the rows), the zigzags of the pairs given to _store_barcode, _finish_deco (the Moebius inversion)
+        # done: the barcodes known beforehand, see _prepare_deco
+        todo_parameters = self._prepare_deco(done=done)
+        with self.stats.phase('pairs', items=len(todo_parameters)):
+            for (b0, d1), barcode in self._compute_pairs(todo_parameters):
+                self._store_barcode(b0, d1, barcode)
+        return self._finish_deco()
 
-        
-        # Each line denotes an interval in the barcode, 
-        # d p q: dimension, birth, death
-        # Note that the birth and death are start and end of the closed integral interval, 
-        # i.e., a line d p q indicates a persistence interval [p,q] in dimensional d 
-        # starting with the complex K_p and ending with the complex K_q.
-        # for i in range(len(barcode)):     
-        #-----------------start of upper layer-----------------
-        # notice that S is initialized with S=[0, NodeToStr[(0, 1)][1]] when using this function 
-        barcode = self.fzz_barcode_compute_upper()
-        self._barcode_info_transform_ul(barcode) # change the indexing
-        print("Upper layer barcode computation complete!")
-        #-----------------end of upper layer-----------------
-
-        e=(m, -1)
-        for l in range(m-1, -1, -1):
-            for b in range(m-l):
-                d=b+l
-                self.variables['c_ss'][(e, (b, d))]=self.d_ss[(b, d)]+self.variables['c_ss'][(e, (b-1, d))]+self.variables['c_ss'][(e, (b, d+1))]-self.variables['c_ss'][(e, (b-1, d+1))]
-
-        self.d_ss={}
-        self.indexAligner = [0, self.NodeToStr[(0, 0)][1]] 
-        # (0,0), notice the difference
-        for i in range(m-1): 
-            self.indexAligner.append(self.indexAligner[-1]+self.PathToStr[(i, 0, i+1, 0)][1])
-        self.indexAligner.append(self.indexAligner[-1]+1)
-        for i in range(m):
-            for j in range(i, m): 
-                self.d_ss[(i, j)]=0
-
-        #-----------------start of lower layer-----------------
-        barcode = self.fzz_barcode_compute_lower()
-        self._barcode_info_transform_ul(barcode)
-        logging.debug("Lower layer barcode computation complete!")
-        #-----------------end of lower layer-----------------
-
-        for l in range(m-1, -1, -1):
-            for b in range(m-l):
-                d=b+l
-                self.variables['c_ss'][((b, d), e)]=self.d_ss[(b, d)]+self.variables['c_ss'][((b-1, d), e)]+self.variables['c_ss'][((b, d+1), e)]-self.variables['c_ss'][((b-1, d+1), e)]
-
-        
-
-        non_vanishing_parameters = []
-        for b0 in range(m):
-            for d1 in range(b0, m):
-                if self.variables['c_ss'][((b0, d1), e)]==0 or self.variables['c_ss'][(e, (b0, d1))]==0: 
-                    continue
-                else:
-                    non_vanishing_parameters.append((b0,d1))
-        barcodes={}
-
-        # def fzz_compute_inside_loop_local(b0, d1,NodeToStr=self.NodeToStr,PathToStr=self.PathToStr):
-        # # def fzz_compute_inside_loop_local(b0, d1):
-        #     print(f"Subprocess - NodeToStr ID: {id(NodeToStr)}")
-        #     print(f"Subprocess - PathToStr ID: {id(PathToStr)}")            
-
-    
-        if not self._enable_multi_processing:
-            NodeToStr=self.NodeToStr
-            PathToStr=self.PathToStr
+    def _compute_pairs(self, todo_parameters):
+        """
+        generator of ((b0,d1), barcode) of the pairs in todo_parameters, as they are computed,
+        the length and the time of each zigzag are added to self.stats
+        """
+        if not self._enable_multi_processing and self._executor is None:
             # Print the progress
-            def fzz_compute_inside_loop_local(b0, d1):
-                from fzzpy import compute as zz_compute
-                zz_compute = partial(zz_compute, algorithm=self._algorithm_phat)
-                # Generate data directly
-                data_source = [NodeToStr[(0, 1)][0]]
-                if 0 < d1:
-                    data_source.append(PathToStr[(0, 1, d1, 1)][0])
-                data_source.append(PathToStr[(d1, 1, b0, 0)][0])
-                if b0 < m-1:
-                    data_source.append(PathToStr[(b0, 0, m-1, 0)][0])
-                # Parse the data source directly to generate filt_simp and filt_op
-                filt_simps, filt_ops = ConnectedPersistenceDiagram._data_source_to_filts(data_source)
-                del data_source
-                # Compute using the directly generated data
-                barcode = zz_compute(filt_simps, filt_ops)
-                return barcode
             progress_count=0
-            for b0,d1 in non_vanishing_parameters:
+            for b0,d1 in todo_parameters:
                 # barcodes[f"{b0}_{d1}"] = self.fzz_compute_inside_loop(b0,d1,m=m,\
                 #                                                           NodeToStr=None,PathToStr=None,\
                 #                                                             dirname=self.txf_dir,\
                 #                                                             fn_prefix=self.txf_basename_wo_ext,\
                 #                                                             clean_up=self.clean_up)
-                barcodes[f"{b0}_{d1}"] = fzz_compute_inside_loop_local(b0,d1)
+                _, barcode, seconds = self.fzz_timed_job(self.deltas, b0, d1, self._algorithm_phat)
+                self.stats.add_pair(b0, d1, self.deltas.pair_length(b0, d1), seconds)
+                yield (b0, d1), barcode
                 progress_count+=1
-                print('\rProgress: {0:.2f}％ '.format(100*progress_count/len(non_vanishing_parameters)), end='')
+                print('\rProgress: {0:.2f}％ '.format(100*progress_count/len(todo_parameters)), end='')
         else:
             # Parallelize the loop
             from os import cpu_count
@@ -576,24 +852,57 @@ def fzz_compute_inside_loop_local(b0, d1):
             logging.debug("Starting parallel computation of barcodes...")
             max_cores=cpu_count() 
             num_cores=self._num_cores
-            if num_cores == -1: # if -1 then default to max_cores-2
+            if self._executor is not None and self._backend == 'processes':
+                num_cores = self._executor.num_cores
+            elif num_cores == -1: # if -1 then default to max_cores-2
                 num_cores = max(1,max_cores-2)
             elif self._num_cores > max_cores:
                 print(f"Number of cores specified ({num_cores}) is larger than the maximum number of cores ({max_cores}).")
                 print(f"Resetting number of cores to {max_cores}.")
                 num_cores=max_cores
             print('Number of cores being used:',num_cores)
-            print(f"Number of non-vanishing parameters: {len(non_vanishing_parameters)}")
-            args_list = [(b0, d1, self.m, self.NodeToStr, self.PathToStr, self._algorithm_phat) for b0, d1 in non_vanishing_parameters]
+            print(f"Number of non-vanishing parameters: {len(self._deco_state['non_vanishing_parameters'])}")
+            args_list = [(b0, d1, self._algorithm_phat) for b0, d1 in todo_parameters]
+            costs = [self.deltas.pair_length(b0, d1) for b0, d1 in todo_parameters]
+            lengths = dict(zip(todo_parameters, costs))
+            batches = self.schedule_jobs(args_list, costs, num_cores)
             # ----Pool----
-            # Use Pool for parallel processing
+            # Use Pool for parallel processing, or the long-lived pool of the executor
+            # the delta store is published once into shared memory,
+            # workers attach to it with the first batch they get
+            # with the threads backend, the threads share self.deltas and nothing is copied
             from multiprocessing import Pool
-            with Pool(processes=num_cores) as pool:
-                results = list(\
-                    tqdm(\
-                        pool.imap(self.fzz_compute_inside_loop_local_mp,args_list),
-                                    total=len(non_vanishing_parameters), desc="Progress"))
-                #imap_unordered returns results as soon as they are ready, not in order
+            from multiprocessing.pool import ThreadPool
+            shm = None
+            if self._backend == 'threads':
+                deltas, algorithm_phat = self.deltas, self._algorithm_phat
+                def compute_batch(batch):
+                    return [self.fzz_timed_job(deltas, b0, d1, algorithm_phat) for b0, d1, _ in batch]
+                pool = ThreadPool(processes=num_cores)
+                tasks = batches
+            else:
+                compute_batch = self.fzz_compute_batch_mp
+                shm, handle = self.deltas.share()
+                pool = Pool(processes=num_cores) if self._executor is None else None
+                tasks = [(handle, batch) for batch in batches]
+            try:
+                executor = pool if pool is not None else self._executor
+                with tqdm(total=len(todo_parameters), desc="Progress") as progress_bar:
+                    #imap_unordered returns results as soon as they are ready, not in order
+                    for results in executor.imap_unordered(compute_batch, tasks):
+                        for (b0, d1), barcode, seconds in results:
+                            self.stats.add_pair(b0, d1, lengths[(b0, d1)], seconds)
+                            yield (b0, d1), barcode
+                        progress_bar.update(len(results))
+                if shm is not None and pool is None:
+                    # the workers of the executor outlive the diagram, release the block there too
+                    self._executor.broadcast(self._detach_worker_deltas, handle[0])
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
             #----
             #----joblib----
             # from joblib import Parallel, delayed
@@ -603,99 +912,205 @@ def fzz_compute_inside_loop_local(b0, d1):
             #         for param in args_list
             #         )
             #----
-    
-            # cost little time
-            for b0, d1 in non_vanishing_parameters:
-                barcodes[f"{b0}_{d1}"] = results.pop(0)
+
+    def _prepare_deco(self, done=None):
+        """
+        First part of deco(): the upper and lower rows, and the pairs (b0,d1) that do not vanish.
+        done: barcodes already computed, as a dict from (b0,d1) to barcodes,
+            with the keys BarcodeCheckpoint.UPPER and LOWER for the rows
+        Returns the pairs whose zigzags are left to compute,
+        they are given back with _store_barcode before _finish_deco is called.
+        """
+        m = self.m
+        dims = self.dims
+        # one c_ss for each dimension, zeros with the layout of the shared template,
+        # or of the compressed ladder when the columns are merged, the template is then of the original length
+        if self._uncompressed is None:
+            c_ss = {dim: self.variables['c_ss'].zeros_like() for dim in dims}
+        else:
+            c_ss = {dim: DenseCss(m) for dim in dims}
+        # print("全ての道の差分リストを構築")
+        print("Building the difference list of all paths...")
+        # self.indexAligner is used to align the index in the commutative ladder
+        # with the index when all simplicial complex get expanded and inserted one by one
+        # and then computed using fzz
+        # (0,1), notice the difference
+        self.indexAligner = self._index_aligner([len(self.deltas.nodes[1])]+\
+                                                [self.deltas.length(i, 1, i+1, 1) for i in range(m-1)])
+        print("Difference list building complete.")
+        checkpoint = None
+        done = dict(done) if done else {}
+        if self._checkpoint_dir:
+            checkpoint = BarcodeCheckpoint(self._checkpoint_dir, self.deltas.fingerprint())
+            done.update(checkpoint.load())
+            if done:
+                print(f"Resuming from the checkpoint {checkpoint.filepath}, {len(done)} barcodes loaded.")
+
         
-        # the loop below costs very little time
-        for b0 in range(m):
-            for d1 in range(b0, m):
-                # Recall that e=(m, -1)
-                if self.variables['c_ss'][((b0, d1), e)]==0 or self.variables['c_ss'][(e, (b0, d1))]==0: 
-                    continue 
-                self.d_ss={}
-                self.indexAligner=[0, self.NodeToStr[(0, 1)][1]]
-                for i in range(d1): 
-                    self.indexAligner.append(self.indexAligner[-1]+self.PathToStr[(i, 1, i+1, 1)][1])
-                self.indexAligner.append(self.indexAligner[-1]+self.PathToStr[(d1, 1, b0, 0)][1])
-                for i in range(b0, m-1): 
-                    self.indexAligner.append(self.indexAligner[-1]+self.PathToStr[(i, 0, i+1, 0)][1])
-                self.indexAligner.append(self.indexAligner[-1]+1)
-                for b1 in range(b0+1):
-                    for d0 in range(d1, m): 
-                        self.d_ss[((b0, d0), (b1, d1))]=0
-                for interval in barcodes[f"{b0}_{d1}"]:
-                    current_dim, p, q = interval #map(int, interval.rstrip().split())
-                    if current_dim != dim:
-                        continue
-                    if self.indexAligner[d1+1]<p or q<self.indexAligner[d1+2]: 
-                        continue
-                    for j in range(d1+1): 
-                        if self.indexAligner[j]<p and p<=self.indexAligner[j+1]: 
-                            b1=j
-                            break
-                    for j in range(b0, m): 
-                        if self.indexAligner[d1+2+j-b0]<=q and q<self.indexAligner[d1+3+j-b0]: 
-                            d0=j
-                            break
-                    if b1<=d0: 
-                        try:
-                            self.d_ss[(b0, d0), (b1, d1)]+=1
-                        except KeyError:
-                            import pdb
-                            pdb.set_trace()
-                            1+1
-                self.variables['c_ss'][((b0, m), (-1, d1))]=0
-                for i in range(d1, m): 
-                    self.variables['c_ss'][((b0, i), (-1, d1))]=0
-                for i in range(b0+1): 
-                    self.variables['c_ss'][((b0, m), (i, d1))]=0
-                for l in range(m-1, d1-b0-1, -1):
-                    for b1 in range(m-l):
-                        if b0<b1: 
-                            break
-                        d0=b1+l
-                        if d0<d1 or m-1<d0: 
-                            continue
-                        self.variables['c_ss'][((b0, d0), (b1, d1))]=self.d_ss[((b0, d0), (b1, d1))]+self.variables['c_ss'][((b0, d0), (b1-1, d1))]+self.variables['c_ss'][((b0, d0+1), (b1, d1))]-self.variables['c_ss'][((b0, d0+1), (b1-1, d1))]      
+        # Each line denotes an interval in the barcode, 
+        # d p q: dimension, birth, death
+        # Note that the birth and death are start and end of the closed integral interval, 
+        # i.e., a line d p q indicates a persistence interval [p,q] in dimensional d 
+        # starting with the complex K_p and ending with the complex K_q.
+        # for i in range(len(barcode)):     
+        #-----------------start of upper layer-----------------
+        # notice that S is initialized with S=[0, len(self.deltas.nodes[1])] when using this function 
+        barcode = done.get(BarcodeCheckpoint.UPPER)
+        if barcode is None:
+            with self.stats.phase('upper_barcode') as record:
+                barcode = np.asarray(self.fzz_barcode_compute_upper(), dtype=np.int64).reshape(-1, 3)
+                record['items'] += len(barcode)
+            if checkpoint: checkpoint.append(BarcodeCheckpoint.UPPER, barcode)
+        if self._extension is not None:
+            self._extension['barcodes'] = {BarcodeCheckpoint.UPPER: barcode}
+        print("Upper layer barcode computation complete!")
+        #-----------------end of upper layer-----------------
+
+        rows = {'upper': {}, 'lower': {}} # the barcodes of the rows, as the d_ss arrays [b,d] of each dimension
+        for dim in dims:
+            self.d_ss = self._barcode_info_transform_ul(barcode, dim) # change the indexing
+            rows['upper'][dim] = self.d_ss
+            # e=(m, -1) denotes the empty row
+            # c_ss[(e,(b,d))]=d_ss[(b,d)]+c_ss[(e,(b-1,d))]+c_ss[(e,(b,d+1))]-c_ss[(e,(b-1,d+1))]
+            c_ss[dim].upper[1:m+1, 1:m+1]=DenseCss.ss_cumsum(self.d_ss)
+
+        # (0,0), notice the difference
+        self.indexAligner = self._index_aligner([len(self.deltas.nodes[0])]+\
+                                                [self.deltas.length(i, 0, i+1, 0) for i in range(m-1)])
+
+        #-----------------start of lower layer-----------------
+        barcode = done.get(BarcodeCheckpoint.LOWER)
+        if barcode is None:
+            with self.stats.phase('lower_barcode') as record:
+                barcode = np.asarray(self.fzz_barcode_compute_lower(), dtype=np.int64).reshape(-1, 3)
+                record['items'] += len(barcode)
+            if checkpoint: checkpoint.append(BarcodeCheckpoint.LOWER, barcode)
+        if self._extension is not None:
+            self._extension['barcodes'][BarcodeCheckpoint.LOWER] = barcode
+        logging.debug("Lower layer barcode computation complete!")
+        #-----------------end of lower layer-----------------
+
+        non_vanishing = {}
+        for dim in dims:
+            self.d_ss = self._barcode_info_transform_ul(barcode, dim)
+            rows['lower'][dim] = self.d_ss
+            # c_ss[((b,d),e)]=d_ss[(b,d)]+c_ss[((b-1,d),e)]+c_ss[((b,d+1),e)]-c_ss[((b-1,d+1),e)]
+            c_ss[dim].lower[1:m+1, 1:m+1]=DenseCss.ss_cumsum(self.d_ss)
+            # the pairs (b0,d1) with both c_ss[((b0,d1),e)] and c_ss[(e,(b0,d1))] nonzero
+            non_vanishing[dim] = np.triu((c_ss[dim].lower[1:m+1, 1:m+1]!=0) & (c_ss[dim].upper[1:m+1, 1:m+1]!=0))
+        # the zigzag of a pair is computed once for all the dimensions where it does not vanish
+        non_vanishing_parameters = [(int(b0), int(d1)) for b0, d1 in zip(*np.nonzero(np.logical_or.reduce(list(non_vanishing.values()))))]
+        # known[dim][k]: c_ss[dim].values[k] is final, i.e. the rows, the sentinels and the vanishing pairs,
+        # the other pairs are known once their barcodes are stored, see partial_dec
+        known = {}
+        for dim in dims:
+            known[dim] = np.zeros(len(c_ss[dim].values), dtype=bool)
+            known[dim][:2*(m+2)**2] = True
+            for b0, d1 in zip(*np.nonzero(np.triu(~non_vanishing[dim]))):
+                known[dim][self._pair_slice(c_ss[dim], b0, d1)] = True
+        self._deco_state = {'c_ss': c_ss, 'non_vanishing': non_vanishing, 'non_vanishing_parameters': non_vanishing_parameters,
+                            'checkpoint': checkpoint, 'known': known, 'rows': rows}
+        # the pairs left to compute, one for each zigzag sequence,
+        # the pairs with the same sequence (see LadderDeltaStore.pair_key) get its barcode in _store_barcode
+        done_by_key = {self.deltas.pair_key(*pair): barcode for pair, barcode in done.items() if pair[0] != -1}
+        computed_by_key = {}
+        same_sequence = self._deco_state['same_sequence'] = {} # pair computed -> the other pairs with its sequence
+        todo_parameters = []
+        for b0, d1 in non_vanishing_parameters:
+            key = self.deltas.pair_key(b0, d1)
+            if (b0, d1) in done:
+                self._fill_pair(b0, d1, done[(b0, d1)])
+            elif key in done_by_key:
+                self._fill_pair(b0, d1, done_by_key[key])
+            elif key in computed_by_key:
+                same_sequence[computed_by_key[key]].append((b0, d1))
+            else:
+                computed_by_key[key] = (b0, d1)
+                same_sequence[(b0, d1)] = []
+                todo_parameters.append((b0, d1))
+        logging.debug(f"{sum(map(len, same_sequence.values()))} pairs reuse the zigzag of another pair")
+        return todo_parameters
+
+    @staticmethod
+    def _pair_slice(c_ss, b0, d1):
+        """the block of the pair (b0,d1) in c_ss.values"""
+        i = c_ss.pair_index(b0, d1)
+        offset = 2*(c_ss.m+2)**2
+        return slice(offset+int(c_ss.pair_offsets[i]), offset+int(c_ss.pair_offsets[i+1]))
+
+    def _fill_pair(self, b0, d1, barcode):
+        """the c_ss of the pair (b0,d1) from its barcode, in every dimension where it does not vanish"""
+        m = self.m
+        state = self._deco_state
+        self.indexAligner=self._index_aligner([len(self.deltas.nodes[1])]+\
+                                              [self.deltas.length(i, 1, i+1, 1) for i in range(d1)]+\
+                                              [self.deltas.length(d1, 1, b0, 0)]+\
+                                              [self.deltas.length(i, 0, i+1, 0) for i in range(b0, m-1)])
+        barcode = np.asarray(barcode, dtype=np.int64).reshape(-1, 3)
+        if self._extension is not None:
+            self._extension['barcodes'][(b0, d1)] = barcode
+        for dim in self.dims:
+            if not state['non_vanishing'][dim][b0, d1]:
+                continue
+            c_ss = state['c_ss'][dim]
+            self.d_ss=self._barcode_info_transform_pair(barcode, b0, d1, dim)
+            # c_ss[((b0,d0),(b1,d1))]=d_ss[((b0,d0),(b1,d1))]+c_ss[((b0,d0),(b1-1,d1))]+c_ss[((b0,d0+1),(b1,d1))]-c_ss[((b0,d0+1),(b1-1,d1))]
+            # with zeros at the sentinels b1=-1 and d0=m
+            c_ss.pair(b0, d1)[...]=DenseCss.ss_cumsum(self.d_ss[:b0+1, d1:])
+            state['known'][dim][self._pair_slice(c_ss, b0, d1)] = True
+
+    def _store_barcode(self, b0, d1, barcode):
+        """
+        fill the c_ss of the pair (b0,d1) from its barcode, and checkpoint it,
+        the pairs with the same zigzag sequence are filled too, each with its own indexAligner.
+        Returns the pairs filled.
+        """
+        checkpoint = self._deco_state['checkpoint']
+        pairs = [(b0, d1)] + self._deco_state['same_sequence'].get((b0, d1), [])
+        for pair in pairs:
+            self._fill_pair(*pair, barcode)
+        if checkpoint: checkpoint.append((b0, d1), barcode)
+        return pairs
+
+    def _finish_deco(self):
+        """Last part of deco(): the Moebius inversion, once every pair is stored"""
+        dims = self.dims
+        c_ss, checkpoint = self._deco_state['c_ss'], self._deco_state['checkpoint']
+        del self._deco_state
+        if checkpoint:
+            # every barcode is computed
+            if self.clean_up:
+                checkpoint.remove()
+            else:
+                checkpoint.close()
+        if self._uncompressed is not None:
+            # back to the original columns
+            columns = self._original_columns()
+            c_ss = {dim: c_ss[dim].expand(columns) for dim in dims}
+            self.m = self._uncompressed
+            self._uncompressed = None
         # last info
         print("Finishing up...")
-        delt_ss={}
-
-        for I in self.intv:
-            t = len(self.variables['cov'][I]); 
-            subs = 1 << t
-            ans_ss = 0
-            for s in range(subs):
-                js = I
-                sl = 0
-                for j in range(t):
-                    if (1 << j) & s:
-                        sl += 1
-                        js = self.join_intv(js, self.variables['cov'][I][j])
-                # remove the usage of (-1)^sl
-                # ans_ss += ((-1)**sl)*self.variables['c_ss'][js]
-                if sl%2==0:
-                    ans_ss += self.variables['c_ss'][js]
-                else:
-                    ans_ss -= self.variables['c_ss'][js]
-            delt_ss[I] = ans_ss
+        # Moebius inversion over the covers, precomputed as a sparse table
+        with self.stats.phase('moebius', items=len(self.intv)*len(dims)):
+            delt_ss={dim: dict(zip(self.intv, self.variables['moebius'].apply(c_ss[dim]).tolist())) for dim in dims}
 
-        del self.NodeToStr
-        del self.PathToStr
-        self.logging_memory_usage_of_attributes()
-        return delt_ss
+        if self._extension is None:
+            del self.deltas
+        # walking every attribute with pympler is slow, only done when debugging, self.stats has the peak RSS
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            self.logging_memory_usage_of_attributes()
+        return delt_ss, c_ss
 
     def compute_dec_obj(self):
         if not hasattr(self, 'delt_ss'):
             raise ValueError('delt_ss not computed yet.')
-        dec = {}
-        for I in self.intv:
-            if self.delt_ss[I] != 0:
-                S = f"{I[0][0]},{I[0][1]},{I[1][0]},{I[1][1]}"
-                dec[S] = self.delt_ss[I]
-        self.dec = dec
+        # the nonzero intervals as an integer array of rows b0,d0,b1,d1,multiplicity, in the order of intv
+        multiplicities = np.fromiter(self.delt_ss.values(), dtype=np.int64, count=len(self.delt_ss))
+        intervals = np.array(list(self.delt_ss.keys()), dtype=np.int64).reshape(-1, 4)
+        nonzero = multiplicities != 0
+        self._dec_array = np.column_stack([intervals[nonzero], multiplicities[nonzero]])
+        self.dec = {f"{b0},{d0},{b1},{d1}": mult for b0, d0, b1, d1, mult in self._dec_array.tolist()}
 
     def wake(self, I):
         # for 分ける
@@ -704,62 +1119,69 @@ def wake(self, I):
         K = I.split(',')
         return [f"{K[0]},{K[1]},{m},-1", f"{m},-1,{K[2]},{K[3]}"]
 
+    def _dot_grids(self):
+        """
+        The multiplicities of the dots of the lower and the upper rows, as (m+1)x(m+1) arrays,
+        the dot (b,d) is at [b,d], and the empty row e=(m,-1) is at [m,-1].
+        """
+        m = self.m
+        b0, d0, b1, d1, mult = self._dec_array.T
+        lower = np.zeros((m+1, m+1), dtype=np.int64)
+        upper = np.zeros((m+1, m+1), dtype=np.int64)
+        np.add.at(lower, (b0, d0), mult)
+        np.add.at(upper, (b1, d1), mult)
+        return lower, upper
+
     def compute_dotdec(self):
         '''Generate decomposition for dots
         '''
         m = self.m
+        lower, upper = self._dot_grids()
         dotdec = {}  # empty dict
-        dotdec[f"{m},-1,{m},-1"] = 0
+        dotdec[f"{m},-1,{m},-1"] = int(lower[m, -1]+upper[m, -1])
         for i in range(m):
             for j in range(i, m):
-                dotdec[f"{i},{j},{m},-1"] = 0
-                dotdec[f"{m},-1,{i},{j}"] = 0
-        for I in self.dec:
-            J = self.wake(I)
-            dotdec[J[0]] += self.dec[I]
-            dotdec[J[1]] += self.dec[I]
+                dotdec[f"{i},{j},{m},-1"] = int(lower[i, j])
+                dotdec[f"{m},-1,{i},{j}"] = int(upper[i, j])
         self.dotdec = dotdec
 
     def compute_connecting_lines(self):
         if not hasattr(self, 'dec'):
             raise ValueError('decomposition not computed yet.')
-        m = self.m
-        # initiate a pandas dataframe with specified types
-        container = pd.DataFrame(
-            {'x0': pd.Series(dtype='int'),
-             'y0': pd.Series(dtype='int'),
-             'x1': pd.Series(dtype='int'),
-             'y1': pd.Series(dtype='int'),
-             'multiplicity': pd.Series(dtype='int')
-             })
-             # (x0,y0) bottom right; (x1,y1) top left
-        for I in self.dec:
-            (b1, d1, b2, d2)=map(lambda x: int(x)+1, I.split(','))
-            if(d1 <= 0 or d2 <= 0 or (b1 == d1 and b2 == d2)):
-                continue
-            slope = (d2-b1)/(d1-b2)
-            if slope <= 1:
-                # notice that the y-coordinate in html canvas is inverted
-                container.loc[len(container)]= [d1, b1, b2, d2, self.dec[I]]
-        self.lines= container
+        # (x0,y0) bottom right; (x1,y1) top left
+        b1, d1, b2, d2, mult = self._dec_array.T
+        b1, d1, b2, d2 = b1+1, d1+1, b2+1, d2+1
+        # the pairs of rows, except the single dots (b1 == d1 and b2 == d2)
+        keep = (d1 > 0) & (d2 > 0) & ~((b1 == d1) & (b2 == d2))
+        # slope = (d2-b1)/(d1-b2) <= 1, with d1 > b2 for the pairs kept
+        keep &= (d2-b1) <= (d1-b2)
+        # notice that the y-coordinate in html canvas is inverted
+        lines = np.empty(int(keep.sum()), dtype=[('x0', 'i8'), ('y0', 'i8'), ('x1', 'i8'), ('y1', 'i8'), ('multiplicity', 'i8')])
+        lines['x0'], lines['y0'], lines['x1'], lines['y1'], lines['multiplicity'] = d1[keep], b1[keep], b2[keep], d2[keep], mult[keep]
+        self._lines = lines
+        self._lines_df = self._plot_data = None
 
     def compute_plot_dots(self):
         if not hasattr(self, 'dotdec'):
             raise ValueError('dot decomposition not computed yet.')
         m= self.m
-        # initiate a pandas dataframe with specified types
-        container = pd.DataFrame(
-            {'x': pd.Series(dtype='int'),
-             'y': pd.Series(dtype='int'),
-             'multiplicity': pd.Series(dtype='int'),
-             'area': pd.Series(dtype='str')
-             })
-        for i in range(m):
-            for j in range(i, m):
-                D= self.dotdec[f"{i},{j},{m},-1"]
-                U= self.dotdec[f"{m},-1,{i},{j}"]
-                if D != 0:
-                    container.loc[len(container)] = [j+1, i+1, D, 'D',] 
-                if U != 0:
-                    container.loc[len(container)] = [i+1, j+1, U, 'U',]
-        self.dots= container
\ No newline at end of file
+        lower, upper = self._dot_grids()
+        i, j = np.triu_indices(m)
+        # for each (i,j), the lower dot then the upper dot, the order in which the rows used to be appended
+        dots = np.empty((len(i), 2), dtype=[('x', 'i8'), ('y', 'i8'), ('multiplicity', 'i8'), ('area', 'U1')])
+        dots['x'][:, 0], dots['y'][:, 0], dots['multiplicity'][:, 0], dots['area'][:, 0] = j+1, i+1, lower[i, j], 'D'
+        dots['x'][:, 1], dots['y'][:, 1], dots['multiplicity'][:, 1], dots['area'][:, 1] = i+1, j+1, upper[i, j], 'U'
+        dots = dots.reshape(-1)
+        self._dots = dots[dots['multiplicity'] != 0]
+        self._dots_df = self._plot_data = None
+
+
+@lru_cache(maxsize=PRECOMPUTED_CACHE_SIZE)
+def precomputed_tables(m, n=2):
+    """
+    The read-only tables of the ladder of length m, loaded or computed once per process,
+    the PRECOMPUTED_CACHE_SIZE lengths used last are kept.
+    Every diagram of length m shares them and fills its own c_ss (DenseCss.zeros_like of the template).
+    precomputed_tables.cache_clear() releases them.
+    """
+    return freeze_precomputed(*ConnectedPersistenceDiagram._read_precomputed(m, n))
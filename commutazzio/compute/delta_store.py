@@ -0,0 +1,239 @@
+"""
+Storage of the simplex deltas of a commutative ladder CL(m).
+
+Only the O(m) single-step deltas are stored:
+    - the nodes (0,b) of the leftmost column,
+    - the horizontal steps (a,b) -> (a+1,b) of each row, concatenated into one flat array per row,
+    - the vertical steps (a,0) -> (a,1), concatenated into one flat array.
+Any path is composed on demand out of slices of these arrays.
+
+A delta is a tuple of an int32 array of simplex IDs and a bool array of operations,
+True for insertion and False for deletion.
+
+All arrays can be published into one shared memory block (share),
+worker processes attach to it without copying (attach).
+"""
+import numpy as np
+from operator import itemgetter
+from multiprocessing.shared_memory import SharedMemory
+
+
+class LadderDeltaStore():
+    def __init__(self, nodes, steps, verticals, simplices):
+        """
+        nodes: list of arrays, nodes[b] contains the simplices of the node (0,b)
+        steps: list of lists of arrays, steps[b][a] contains the simplices added from (a,b) to (a+1,b)
+        verticals: list of arrays, verticals[a] contains the simplices added from (a,0) to (a,1)
+        simplices: list of simplices (lists of vertices), indexed by simplex IDs,
+            sorted by the number of vertices first
+        each array shall be sorted in the insertion order
+        """
+        if len(nodes) != 2:
+            raise NotImplementedError("Only commutative ladders (n=2) are supported.")
+        arrays = {}
+        for b in range(len(nodes)):
+            arrays[f'node_{b}'] = np.asarray(nodes[b], dtype=np.int32)
+            arrays[f'row_{b}'], arrays[f'row_offsets_{b}'] = self._flatten(steps[b])
+        arrays['verticals'], arrays['vertical_offsets'] = self._flatten(verticals)
+        # simplices of the same dimension have consecutive IDs,
+        # store them as a table of vertices for each dimension
+        lengths = [len(simplex) for simplex in simplices]
+        dim_offsets = np.searchsorted(lengths, np.arange(1, max(lengths, default=0)+2), side='left')
+        arrays['dim_offsets'] = dim_offsets.astype(np.int64)
+        for k in range(len(dim_offsets)-1):
+            table = simplices[dim_offsets[k]:dim_offsets[k+1]]
+            arrays[f'simplices_{k}'] = np.array(table, dtype=np.int32).reshape(len(table), k+1)
+        self._set_arrays(arrays)
+
+    def _set_arrays(self, arrays):
+        self._arrays = arrays
+        self.n = len([name for name in arrays if name.startswith('node_')])
+        self.nodes = [arrays[f'node_{b}'] for b in range(self.n)]
+        self.rows = [arrays[f'row_{b}'] for b in range(self.n)]
+        self.row_offsets = [arrays[f'row_offsets_{b}'] for b in range(self.n)]
+        self.verticals = arrays['verticals']
+        self.vertical_offsets = arrays['vertical_offsets']
+        self.m = len(self.vertical_offsets)-1
+        self.dim_offsets = arrays['dim_offsets']
+        self.simplex_tables = [arrays[f'simplices_{k}'] for k in range(len(self.dim_offsets)-1)]
+        longest = max([len(ids) for ids in self.nodes] + [len(ids) for ids in self.rows] + [len(self.verticals)])
+        self._insertions = np.ones(longest, dtype=np.bool_)
+        self._deletions = np.zeros(longest, dtype=np.bool_)
+
+    def __getstate__(self):
+        return self._arrays
+
+    def __setstate__(self, arrays):
+        self._set_arrays(arrays)
+
+    def fingerprint(self):
+        """hex digest of all the arrays, identifies the ladder"""
+        import hashlib
+        digest = hashlib.sha1()
+        for name in sorted(self._arrays):
+            digest.update(name.encode())
+            digest.update(np.ascontiguousarray(self._arrays[name]).tobytes())
+        return digest.hexdigest()
+
+    @property
+    def num_simplices(self):
+        return int(self.dim_offsets[-1])
+
+    def share(self):
+        """
+        Publish all arrays into one shared memory block.
+        Returns the block, to be closed and unlinked by the caller once the workers are done,
+        and a picklable handle to be passed to attach().
+        """
+        layout = []
+        size = 0
+        for name, array in self._arrays.items():
+            size = -(-size // 8) * 8 # 8-byte alignment
+            layout.append((name, array.dtype.str, array.shape, size))
+            size += array.nbytes
+        shm = SharedMemory(create=True, size=max(size, 1))
+        for name, dtype, shape, offset in layout:
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            view[...] = self._arrays[name]
+            del view # release the exported buffer, otherwise shm cannot be closed
+        return shm, (shm.name, layout)
+
+    @classmethod
+    def attach(cls, handle):
+        """Zero-copy, read-only store on a shared memory block created by share()"""
+        name, layout = handle
+        shm = SharedMemory(name=name)
+        arrays = {}
+        for array_name, dtype, shape, offset in layout:
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            array.flags.writeable = False
+            arrays[array_name] = array
+        store = cls.__new__(cls)
+        store._set_arrays(arrays)
+        store._shm = shm # keep the block mapped as long as the store is alive
+        return store
+
+    def detach(self):
+        """release a store created by attach(), it must not be used afterwards"""
+        shm = self._shm
+        del self._arrays, self.nodes, self.rows, self.row_offsets, self.verticals, self.vertical_offsets
+        del self.dim_offsets, self.simplex_tables, self._shm
+        shm.close()
+
+    @staticmethod
+    def _flatten(arrays):
+        """concatenate arrays, return the flat array and the offsets"""
+        offsets = np.zeros(len(arrays)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(ids) for ids in arrays])
+        if len(arrays) == 0:
+            return np.zeros(0, dtype=np.int32), offsets
+        return np.concatenate(arrays).astype(np.int32, copy=False), offsets
+
+    def _insert(self, ids):
+        return ids, self._insertions[:len(ids)]
+
+    def _delete(self, ids):
+        return ids[::-1], self._deletions[:len(ids)]
+
+    def _row(self, b, a, c):
+        """simplices added from (a,b) to (c,b), a<=c"""
+        off = self.row_offsets[b]
+        return self.rows[b][off[a]:off[c]]
+
+    def _vertical(self, a):
+        off = self.vertical_offsets
+        return self.verticals[off[a]:off[a+1]]
+
+    def node(self, a, b):
+        """segments of the node (a,b), from the empty complex"""
+        return [self._insert(self.nodes[b]), self._insert(self._row(b, 0, a))]
+
+    def segments(self, a, b, c, d):
+        """
+        segments (views, no copy) of the path from (a,b) to (c,d).
+        Supported paths are the ones along a row, and the ones
+        from the lower row to the upper row (a<=c) or backwards (c<=a).
+        """
+        if b == d:
+            if a <= c:
+                return [self._insert(self._row(b, a, c))]
+            return [self._delete(self._row(b, c, a))]
+        if (b, d) == (0, 1) and a <= c:
+            return [self._insert(self._row(0, a, c)), self._insert(self._vertical(c))]
+        if (b, d) == (1, 0) and c <= a:
+            return [self._delete(self._row(1, c, a)), self._delete(self._vertical(c))]
+        raise ValueError(f"Path from {(a, b)} to {(c, d)} is not supported.")
+
+    def __getitem__(self, key):
+        """the path key=(a,b,c,d) as a concatenated buffer"""
+        return self.join(self.segments(*key))
+
+    def length(self, a, b, c, d):
+        """number of simplices in the path from (a,b) to (c,d)"""
+        return sum(len(ids) for ids, _ in self.segments(a, b, c, d))
+
+    def pair_segments(self, b0, d1):
+        """
+        segments of the zigzag sequence of the pair (b0,d1):
+        node (0,1) -> (d1,1) -> (b0,1) -> (b0,0) -> (m-1,0)
+        """
+        segments = self.node(0, 1)
+        segments += self.segments(0, 1, d1, 1)
+        segments += self.segments(d1, 1, b0, 0)
+        segments += self.segments(b0, 0, self.m-1, 0)
+        return segments
+
+    def pair_key(self, b0, d1):
+        """
+        key of the zigzag sequence of the pair (b0,d1), computed from the offsets without building the sequence:
+        pairs with the same key have the same sequence, e.g. when the upper row does not change between their d1.
+        The segments are slices of the flat arrays, given by their bounds, empty vertical steps are all the same.
+        """
+        vertical = self.vertical_offsets[b0:b0+2]
+        vertical = (int(vertical[0]), int(vertical[1])) if vertical[1] > vertical[0] else None
+        return int(self.row_offsets[1][d1]), int(self.row_offsets[1][b0]), vertical, int(self.row_offsets[0][b0])
+
+    def pair_length(self, b0, d1):
+        """number of simplices in the zigzag sequence of the pair (b0,d1)"""
+        return sum(len(ids) for ids, _ in self.pair_segments(b0, d1))
+
+    @staticmethod
+    def join(segments):
+        """concatenate segments into one delta"""
+        return np.concatenate([s[0] for s in segments]), np.concatenate([s[1] for s in segments])
+
+    def simplex(self, i):
+        """vertices of the simplex with ID i"""
+        k = int(np.searchsorted(self.dim_offsets, i, side='right'))-1
+        return self.simplex_tables[k][i-self.dim_offsets[k]].tolist()
+
+    def complexes(self):
+        """
+        The complexes C[a][b] of the ladder, sets of simplices (sorted tuples of vertices),
+        as given to the constructor, rebuilt from the deltas.
+        """
+        simplices = [tuple(simplex) for table in self.simplex_tables for simplex in table.tolist()]
+        lower = {simplices[i] for i in self.nodes[0].tolist()}
+        C = []
+        for a in range(self.m):
+            if a > 0:
+                lower = lower | {simplices[i] for i in self._row(0, a-1, a).tolist()}
+            C.append([lower, lower | {simplices[i] for i in self._vertical(a).tolist()}])
+        return C
+
+    def to_filts(self, segments):
+        """translate segments to the input format of fzz"""
+        ids, ops = self.join(segments)
+        if len(ids) == 0:
+            return [], []
+        dims = np.searchsorted(self.dim_offsets, ids, side='right')-1
+        # gather the vertices dimension by dimension, then restore the order of ids
+        order = np.argsort(dims, kind='stable')
+        sorted_ids, sorted_dims = ids[order], dims[order]
+        rows = []
+        for k, table in enumerate(self.simplex_tables):
+            rows += table[sorted_ids[sorted_dims == k]-self.dim_offsets[k]].tolist()
+        inverse = np.empty(len(ids), dtype=np.int64)
+        inverse[order] = np.arange(len(ids))
+        filt_simps = list(itemgetter(*inverse.tolist())(rows)) if len(ids) > 1 else rows
+        return filt_simps, ops.tolist()
@@ -0,0 +1,109 @@
+"""
+A long-lived pool of worker processes, shared by the computations of
+CLInvariants, ConnectedPersistenceDiagram and CommutativeLadderQuiver.
+
+Starting a pool and importing fzzpy/dionysus in every worker is paid once,
+the executor is then reused across calls and across filtrations:
+
+    with CLExecutor(num_cores=8) as executor:
+        for clf in filtrations:
+            cli = CLInvariants(clf, executor=executor)
+            cli.cPD_computation(homology_dim=1)
+"""
+import os
+from os import cpu_count
+from multiprocessing import Pool, Barrier
+
+_barrier = None # shared by the workers of a CLExecutor, see CLExecutor.broadcast
+
+
+def _warm_up():
+    """Pool initializer, import the zigzag backends once per worker"""
+    for module in ['fzzpy', 'dionysus']:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+
+def _init_worker(barrier, warm_up):
+    """Pool initializer"""
+    global _barrier
+    _barrier = barrier
+    if warm_up:
+        _warm_up()
+
+
+def _run_once_per_worker(func, args):
+    """run func(*args), then wait for the other workers, so that each worker takes exactly one of these tasks"""
+    result = func(*args)
+    _barrier.wait()
+    return result
+
+
+class CLExecutor():
+    def __init__(self, num_cores:int=-1, warm_up:bool=True):
+        """
+        num_cores: number of worker processes, -1 for all the cores but two
+        warm_up: import the zigzag backends in the workers when they start
+        """
+        max_cores = cpu_count()
+        if num_cores == -1: # if -1 then default to max_cores-2
+            num_cores = max(1, max_cores-2)
+        elif num_cores > max_cores:
+            print(f"Number of cores specified ({num_cores}) is larger than the maximum number of cores ({max_cores}).")
+            print(f"Resetting number of cores to {max_cores}.")
+            num_cores = max_cores
+        self.num_cores = num_cores
+        if os.name == 'posix':
+            # start the resource tracker before the workers, so that they share it with this process,
+            # otherwise each worker starts its own one, which reports the shared memory blocks
+            # unlinked by this process (see LadderDeltaStore.share) as leaked
+            from multiprocessing import resource_tracker
+            resource_tracker.ensure_running()
+        self._pool = Pool(processes=num_cores, initializer=_init_worker, initargs=(Barrier(num_cores), warm_up))
+
+    def imap(self, func, iterable, chunksize=1):
+        return self._pool.imap(func, iterable, chunksize)
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        return self._pool.imap_unordered(func, iterable, chunksize)
+
+    def map(self, func, iterable, chunksize=None):
+        return self._pool.map(func, iterable, chunksize)
+
+    def starmap(self, func, iterable, chunksize=None):
+        return self._pool.starmap(func, iterable, chunksize)
+
+    def apply_async(self, func, args=(), kwds={}, callback=None, error_callback=None):
+        return self._pool.apply_async(func, args, kwds, callback, error_callback)
+
+    def broadcast(self, func, *args):
+        """
+        run func(*args) once in every worker, after the tasks already queued,
+        e.g. to release what the workers keep from a finished computation.
+        Returns the results of the workers.
+        """
+        return self._pool.starmap(_run_once_per_worker, [(func, args)]*self.num_cores, chunksize=1)
+
+    def close(self):
+        """wait for the pending tasks, then stop the workers"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
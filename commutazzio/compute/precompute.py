@@ -1,13 +1,471 @@
+import os
+import json
 import pickle
+import shutil
+from collections.abc import Mapping, Sequence
+from types import MappingProxyType
+import numpy as np
+
+PRECOMPUTED_FORMAT_VERSION = 1
+
+
+class DenseCss():
+    """
+    c_ss of the commutative ladder CL(m) (n=2) stored in dense arrays, zero padded for the sentinels -1 and m.
+    e=(m,-1) denotes the empty row.
+        lower[b+1,d+1] is c_ss[((b,d),e)], b,d in -1..m
+        upper[b+1,d+1] is c_ss[(e,(b,d))], b,d in -1..m
+        pair(b0,d1)[b1,d0-d1] is c_ss[((b0,d0),(b1,d1))], b1 in 0..b0, d0 in d1..m-1
+    All the blocks of the pairs (b0,d1) are stored in one flat array,
+    ordered by b0 first then d1.
+    lower, upper and pairs are views of one flat buffer, values,
+    so that any c_ss[I] is values[flat_index(I)].
+    Lookups with the interval tuples work as for the dict version, c_ss[I].
+    """
+    def __init__(self, m, pair_offsets=None):
+        """pair_offsets: the layout of the pairs, e.g. from a binary store, computed if not given"""
+        if pair_offsets is None:
+            pair_offsets = self.layout(m)
+        self._set_values(m, np.zeros(2*(m+2)**2+int(pair_offsets[-1]), dtype=np.int64), pair_offsets)
+
+    @staticmethod
+    def layout(m):
+        """offsets of the blocks of the pairs (b0,d1) in pairs"""
+        sizes = [(b0+1)*(m-d1) for b0 in range(m) for d1 in range(b0, m)]
+        pair_offsets = np.zeros(len(sizes)+1, dtype=np.int64)
+        np.cumsum(sizes, out=pair_offsets[1:])
+        return pair_offsets
+
+    def _set_values(self, m, values, pair_offsets=None):
+        self.m = m
+        self.values = values
+        self.lower = values[:(m+2)**2].reshape(m+2, m+2)
+        self.upper = values[(m+2)**2:2*(m+2)**2].reshape(m+2, m+2)
+        self.pairs = values[2*(m+2)**2:]
+        self.pair_offsets = self.layout(m) if pair_offsets is None else pair_offsets
+
+    def zeros_like(self):
+        """a new c_ss of zeros with the same layout, e.g. the scratch buffer of a diagram from the shared template"""
+        c_ss = DenseCss.__new__(DenseCss)
+        c_ss._set_values(self.m, np.zeros(len(self.values), dtype=np.int64), self.pair_offsets)
+        return c_ss
+
+    def expand(self, columns):
+        """
+        The c_ss of CL(len(columns)), whose column a is the column columns[a] of this ladder (columns is non-decreasing),
+        e.g. the ladder before merging its identical columns: the bars are born at the first column of a run
+        and die at its last one, so c_ss of the long ladder is c_ss here at the corresponding columns.
+        """
+        columns = np.asarray(columns, dtype=np.int64)
+        M = len(columns)
+        expanded = DenseCss(M)
+        # the sentinels -1 and m stay sentinels
+        padded = np.concatenate([[0], columns+1, [self.m+1]])
+        expanded.lower[...] = self.lower[np.ix_(padded, padded)]
+        expanded.upper[...] = self.upper[np.ix_(padded, padded)]
+        for b0 in range(M):
+            for d1 in range(b0, M):
+                block = self.pair(columns[b0], columns[d1])
+                expanded.pair(b0, d1)[...] = block[np.ix_(columns[:b0+1], columns[d1:]-columns[d1])]
+        return expanded
+
+    def restrict(self, columns):
+        """
+        The c_ss of CL(len(columns)), the ladder restricted to the strictly increasing columns of this one.
+        A bar [b,d] becomes [first column >= b, last column <= d], and vanishes when there is none:
+        c_ss is c_ss here at the columns as in expand, except c_ss[b,d] with b>d of the rows,
+        which still count the vanishing bars there, the rows are thus rebuilt from their bars.
+        """
+        columns = np.asarray(columns, dtype=np.int64)
+        restricted = self.expand(columns)
+        m, M = self.m, len(columns)
+        first = np.searchsorted(columns, np.arange(m), side='left')
+        last = np.searchsorted(columns, np.arange(m), side='right')-1
+        for c, r in [(self.lower, restricted.lower), (self.upper, restricted.upper)]:
+            # the bars of the row, d_ss[b,d] the number of bars [b,d], inverting ss_cumsum
+            d_ss = c[1:m+1, 1:m+1]-c[0:m, 1:m+1]-c[1:m+1, 2:m+2]+c[0:m, 2:m+2]
+            b, d = np.nonzero(d_ss)
+            keep = first[b] <= last[d]
+            d_ss_restricted = np.zeros((M, M), dtype=np.int64)
+            np.add.at(d_ss_restricted, (first[b[keep]], last[d[keep]]), d_ss[b[keep], d[keep]])
+            r[1:M+1, 1:M+1] = self.ss_cumsum(d_ss_restricted)
+        return restricted
+
+    def set_read_only(self):
+        for array in [self.values, self.lower, self.upper, self.pairs, self.pair_offsets]:
+            array.setflags(write=False)
+
+    def __getstate__(self):
+        return self.m, self.values
+
+    def __setstate__(self, state):
+        self._set_values(*state)
+
+    def pair_index(self, b0, d1):
+        """position of the pair (b0,d1) in pair_offsets"""
+        return b0*self.m - b0*(b0-1)//2 + d1 - b0
+
+    def pair(self, b0, d1):
+        """the block of the pair (b0,d1) as a (b0+1) x (m-d1) view"""
+        i = self.pair_index(b0, d1)
+        return self.pairs[self.pair_offsets[i]:self.pair_offsets[i+1]].reshape(b0+1, self.m-d1)
+
+    @staticmethod
+    def ss_cumsum(d_ss):
+        """
+        c[b,d] = sum of d_ss[b',d'] over b'<=b and d'>=d,
+        i.e. the recurrence c[b,d] = d_ss[b,d] + c[b-1,d] + c[b,d+1] - c[b-1,d+1]
+        """
+        return np.cumsum(d_ss, axis=0)[:, ::-1].cumsum(axis=1)[:, ::-1]
+
+    def flat_index(self, I):
+        """position of c_ss[I] in values"""
+        m = self.m
+        e = (m, -1)
+        X, Y = I
+        if Y == e:
+            return (X[0]+1)*(m+2) + X[1]+1
+        if X == e:
+            return (m+2)**2 + (Y[0]+1)*(m+2) + Y[1]+1
+        (b0, d0), (b1, d1) = X, Y
+        if d0 == m or b1 == -1: # sentinels, lower[0,0] is a padding zero
+            return 0
+        return 2*(m+2)**2 + int(self.pair_offsets[self.pair_index(b0, d1)]) + b1*(m-d1) + d0-d1
+
+    def __getitem__(self, I):
+        return int(self.values[self.flat_index(I)])
+
+    def flat_indices(self, Z):
+        """flat_index of many intervals at once, Z is an integer array of shape (k,2,2)"""
+        m = self.m
+        b0, d0, b1, d1 = Z[:, 0, 0].astype(np.int64), Z[:, 0, 1].astype(np.int64), Z[:, 1, 0].astype(np.int64), Z[:, 1, 1].astype(np.int64)
+        lower = (b0+1)*(m+2) + d0+1
+        upper = (m+2)**2 + (b1+1)*(m+2) + d1+1
+        upper_empty = (b1 == m) & (d1 == -1)
+        lower_empty = (b0 == m) & (d0 == -1)
+        sentinel = (d0 == m) | (b1 == -1)
+        is_pair = ~(upper_empty | lower_empty | sentinel)
+        i = np.where(is_pair, self.pair_index(b0, d1), 0)
+        pair = 2*(m+2)**2 + self.pair_offsets[i] + b1*(m-d1) + d0-d1
+        return np.select([upper_empty, lower_empty, sentinel], [lower, upper, 0], pair)
+
+
+class MoebiusTable():
+    """
+    The Moebius inversion delt_ss[I] = sum over the subsets S of cov[I] of (-1)^|S| c_ss[join(I,S)],
+    precomputed as a sparse matrix in CSR format:
+    the terms of the i-th interval are indices[indptr[i]:indptr[i+1]] (flat indices of DenseCss)
+    with the coefficients coefs[indptr[i]:indptr[i+1]], the repeated joins are merged.
+    It depends on m only, so it is computed once for every filtration of that length.
+    """
+    def __init__(self, indptr, indices, coefs):
+        self.indptr = indptr
+        self.indices = indices
+        self.coefs = coefs
+
+    @classmethod
+    def from_covers(cls, intv, cov, m):
+        c_ss = DenseCss(m)
+        indptr = np.zeros(len(intv)+1, dtype=np.int64)
+        indices = []
+        coefs = []
+        for i, I in enumerate(intv):
+            terms = {}
+            t = len(cov[I])
+            for s in range(1 << t):
+                js = I
+                sl = 0
+                for j in range(t):
+                    if (1 << j) & s:
+                        sl += 1
+                        js = join_intv(js, cov[I][j], 2)
+                k = c_ss.flat_index(js)
+                terms[k] = terms.get(k, 0) + (1 if sl%2==0 else -1)
+            terms = {k: c for k, c in terms.items() if c != 0}
+            indices.extend(terms.keys())
+            coefs.extend(terms.values())
+            indptr[i+1] = len(indices)
+        return cls(indptr, np.asarray(indices, dtype=np.int64), np.asarray(coefs, dtype=np.int8))
+
+    @classmethod
+    def from_cover_arrays(cls, intervals, cov_indptr, cov_indices, m, chunk_size=1<<16):
+        """
+        The same table as from_covers, from the arrays of interval_array and cover_arrays.
+        The joins are computed for all the intervals with the same number of covers at once,
+        the terms of an interval are kept in the order of their first appearance, as in from_covers.
+        """
+        c_ss = DenseCss(m)
+        counts = np.diff(cov_indptr)
+        if counts.max(initial=0) > 6:
+            raise ValueError("At most 6 covers per interval are expected on a commutative ladder.")
+        k_bits = int(len(c_ss.values)).bit_length()
+        if int(chunk_size).bit_length() + k_bits + 7 > 63:
+            raise ValueError(f"m={m} is too large for the table keys.")
+        indptr = np.zeros(len(intervals)+1, dtype=np.int64)
+        indices, coefs = [], []
+        for start in range(0, len(intervals), chunk_size):
+            stop = min(start+chunk_size, len(intervals))
+            rows = [] # (interval, subset, flat index, sign)
+            for c in np.unique(counts[start:stop]):
+                members = start + np.flatnonzero(counts[start:stop] == c)
+                covers = intervals[cov_indices[cov_indptr[members][:, None] + np.arange(c)]]
+                joins = [intervals[members].astype(np.int64)]
+                for subset in range(1 << c):
+                    if subset:
+                        # the covers are joined in increasing order, the last one is the highest bit
+                        high = subset.bit_length()-1
+                        joins.append(join_intv_array(joins[subset ^ (1 << high)], covers[:, high]))
+                    js = joins[subset]
+                    sign = 1 if bin(subset).count('1')%2 == 0 else -1
+                    rows.append(np.column_stack([members, np.full(len(members), subset), c_ss.flat_indices(js), np.full(len(members), sign)]))
+            # merge the repeated joins of an interval, the first subset gives the position of the term
+            # one int64 key per row, interval | flat index | subset | sign, sorted at once
+            I, S, K, C = np.concatenate(rows).T
+            keys = np.sort((((I-start) << k_bits | K) << 7 | S << 1) | (C > 0))
+            I, K, S, C = (keys >> (k_bits+7)) + start, keys >> 7 & (1 << k_bits)-1, keys >> 1 & 63, 2*(keys & 1)-1
+            first = np.flatnonzero(np.r_[True, (keys[1:] >> 7) != (keys[:-1] >> 7)])
+            I, S, K, C = I[first], S[first], K[first], np.add.reduceat(C, first)
+            nonzero = C != 0
+            I, S, K, C = I[nonzero], S[nonzero], K[nonzero], C[nonzero]
+            order = np.argsort((I-start) << 6 | S)
+            indices.append(K[order])
+            coefs.append(C[order])
+            indptr[start+1:stop+1] = np.cumsum(np.bincount(I-start, minlength=stop-start)) + indptr[start]
+        return cls(indptr, np.concatenate(indices).astype(np.int64), np.concatenate(coefs).astype(np.int8))
+
+    def resolved(self, known):
+        """mask of the intervals whose terms are all known, known is a boolean mask over c_ss.values"""
+        unknown = np.zeros(len(self.indices)+1, dtype=np.int64)
+        np.cumsum(~known[self.indices], out=unknown[1:])
+        return unknown[self.indptr[1:]] == unknown[self.indptr[:-1]]
+
+    def apply(self, c_ss):
+        """delt_ss of all intervals as an int64 array, in the order of intv"""
+        terms = np.zeros(len(self.indices)+1, dtype=np.int64)
+        np.cumsum(self.coefs*c_ss.values[self.indices], out=terms[1:])
+        return terms[self.indptr[1:]] - terms[self.indptr[:-1]]
+
+
+class IntervalArray(Sequence):
+    """
+    The intervals stored as an integer array of shape (number of intervals, n, 2),
+    read as the usual tuples of (birth, death) tuples.
+    """
+    def __init__(self, array):
+        self.array = array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, i):
+        return tuple(map(tuple, self.array[i].tolist()))
+
+    def __iter__(self):
+        return (tuple(map(tuple, I)) for I in self.array.tolist())
+
+
+class CoverTable(Mapping):
+    """
+    The covers in CSR format, the covers of intv[i] are intv[indices[indptr[i]:indptr[i+1]]].
+    Read as the dict cov from an interval to the list of its covers,
+    the index of the intervals is only built on the first lookup.
+    """
+    def __init__(self, intv, indptr, indices):
+        self.intv = intv
+        self.indptr = indptr
+        self.indices = indices
+        self._position = None
+
+    def __len__(self):
+        return len(self.intv)
+
+    def __iter__(self):
+        return iter(self.intv)
+
+    def __getitem__(self, I):
+        if self._position is None:
+            self._position = {J: i for i, J in enumerate(self.intv)}
+        i = self._position[I]
+        return [self.intv[j] for j in self.indices[self.indptr[i]:self.indptr[i+1]]]
+
+
+def precomputed_binary_path(dirpath, m, n):
+    return os.path.join(dirpath, f"precomputed_{m:03d}_{n:03d}.v{PRECOMPUTED_FORMAT_VERSION}")
+
+
+def load_precomputed_binary(dirpath, m, n=2):
+    """
+    Open the binary store written by CommutativeGridPreCompute.save_binary,
+    the arrays are memory-mapped read-only, so that all the processes share the same pages.
+    Returns (intv, variables) as CommutativeGridPreCompute does, or None if there is no store for (m, n).
+    """
+    path = precomputed_binary_path(dirpath, m, n)
+    meta_fn = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_fn):
+        return None
+    with open(meta_fn) as f:
+        meta = json.load(f)
+    if meta['version'] != PRECOMPUTED_FORMAT_VERSION or meta['m'] != m or meta['n'] != n:
+        raise ValueError(f"{path} does not hold the tables of m={m}, n={n} in format {PRECOMPUTED_FORMAT_VERSION}.")
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in meta['arrays']}
+    intv = IntervalArray(arrays['intervals'])
+    variables = {'cov': CoverTable(intv, arrays['cov_indptr'], arrays['cov_indices'])}
+    if n == 2:
+        variables['c_ss'] = DenseCss(m, arrays['css_pair_offsets'])
+        variables['moebius'] = MoebiusTable(arrays['moebius_indptr'], arrays['moebius_indices'], arrays['moebius_coefs'])
+    return intv, variables
+
+
+def interval_array(m, n):
+    """
+    All the intervals of G_{m,n} as an int32 array of shape (number of intervals, n, 2),
+    in the order of the original generator: the intervals of one row (from the top row to the bottom one),
+    then, level by level, the intervals extended by one row, b<=p and p<=d<=q under the last row (p,q).
+    Empty rows are e=(m,-1).
+    """
+    birth, death = np.triu_indices(m)
+    level = np.empty((n*len(birth), n, 2), dtype=np.int32)
+    level[:, :, 0], level[:, :, 1] = m, -1
+    lengths = np.repeat(np.arange(1, n+1), len(birth))
+    for k in range(n):
+        level[k*len(birth):(k+1)*len(birth), k, 0] = birth
+        level[k*len(birth):(k+1)*len(birth), k, 1] = death
+    levels = []
+    while len(level):
+        levels.append(level)
+        grow = lengths < n
+        level, lengths = level[grow], lengths[grow]
+        p = level[np.arange(len(level)), lengths-1, 0].astype(np.int64)
+        q = level[np.arange(len(level)), lengths-1, 1].astype(np.int64)
+        width = q-p+1
+        counts = (p+1)*width
+        parent = np.repeat(np.arange(len(level)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts, counts)
+        child = level[parent]
+        rows = np.arange(len(child))
+        child[rows, lengths[parent], 0] = local // width[parent]
+        child[rows, lengths[parent], 1] = p[parent] + local % width[parent]
+        level, lengths = child, lengths[parent]+1
+    return np.concatenate(levels)
+
+
+def cover_arrays(intervals, m, chunk_size=1<<18):
+    """
+    The covers of the intervals, in the order of the original cover_generator,
+    as CSR arrays (indptr, indices), the covers of intervals[i] are intervals[indices[indptr[i]:indptr[i+1]]].
+    """
+    N, n, _ = intervals.shape
+    flat = intervals.reshape(N, -1).astype(np.int64) + 1
+    base = m+2
+    if base**(2*n) < 2**63:
+        # an interval is encoded by its 2n coordinates in base m+2
+        weights = base**np.arange(2*n-1, -1, -1, dtype=np.int64)
+        keys = flat @ weights
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+        position = lambda C: order[np.searchsorted(sorted_keys, (C.reshape(len(C), -1).astype(np.int64)+1) @ weights)]
+    else:
+        lookup = {row.tobytes(): i for i, row in enumerate(intervals)}
+        position = lambda C: np.array([lookup[row.tobytes()] for row in C.astype(intervals.dtype)], dtype=np.int64)
+    counts, indices = [], []
+    for start in range(0, N, chunk_size):
+        I = intervals[start:start+chunk_size].astype(np.int64)
+        k = np.arange(len(I))
+        nonempty = I[:, :, 1] > -1
+        s = np.argmax(nonempty, axis=1) # first nonempty row
+        t = n-1-np.argmax(nonempty[:, ::-1], axis=1) # last nonempty row
+        b = I[k, t, 0] # birth
+        d = I[k, s, 1] # death
+        candidates = [] # (valid, cover) in the order of cover_generator
+        def cover(valid, j, birth, death):
+            L = I.copy()
+            j = np.where(valid, j, 0)
+            L[k, j, 0] = np.where(valid, birth, L[k, j, 0])
+            L[k, j, 1] = np.where(valid, death, L[k, j, 1])
+            candidates.append((valid, L))
+        cover(t < n-1, np.minimum(t+1, n-1), b, b)
+        cover(s > 0, np.maximum(s-1, 0), d, d)
+        cover(b > 0, t, b-1, I[k, t, 1])
+        for o in range(n-1):
+            j = np.clip(t-1-o, 0, n-2)
+            cover((t-1-o >= s) & (I[k, j+1, 0] < I[k, j, 0]), j, I[k, j, 0]-1, I[k, j, 1])
+        cover(d < m-1, s, I[k, s, 0], d+1)
+        for o in range(n-1):
+            j = np.clip(s+1+o, 1, n-1)
+            cover((s+1+o <= t) & (I[k, j-1, 1] > I[k, j, 1]), j, I[k, j, 0], I[k, j, 1]+1)
+        valid = np.stack([v for v, _ in candidates], axis=1)
+        covers = np.stack([L for _, L in candidates], axis=1)[valid]
+        counts.append(valid.sum(axis=1))
+        indices.append(position(covers))
+    indptr = np.zeros(N+1, dtype=np.int64)
+    np.cumsum(np.concatenate(counts), out=indptr[1:])
+    return indptr, np.concatenate(indices).astype(np.int32)
+
+
+def join_intv_array(X, Y):
+    """join_intv of many pairs of intervals at once, for the commutative ladder (n=2), X and Y of shape (k,2,2)"""
+    Z = np.empty_like(X)
+    Z[:, :, 0] = np.minimum(X[:, :, 0], Y[:, :, 0])
+    Z[:, :, 1] = np.maximum(X[:, :, 1], Y[:, :, 1])
+    both = (Z[:, 0, 1] > -1) & (Z[:, 1, 1] > -1)
+    Z[both & (Z[:, 0, 1] < Z[:, 1, 1]), 0, 1] += 1
+    Z[both & (Z[:, 1, 0] > Z[:, 0, 0]), 1, 0] -= 1
+    return Z
+
+
+def freeze_precomputed(intv, variables):
+    """
+    Read-only (intv, variables), so that one copy can be shared by every diagram of a process:
+    the lists become tuples, the dicts read-only mappings, and the arrays are no longer writeable.
+    """
+    if isinstance(intv, list):
+        intv = tuple(intv)
+    elif isinstance(intv, IntervalArray):
+        intv.array.setflags(write=False)
+    frozen = {}
+    for key, value in variables.items():
+        if isinstance(value, dict):
+            value = MappingProxyType(value)
+        elif isinstance(value, DenseCss):
+            value.set_read_only()
+        elif isinstance(value, (MoebiusTable, CoverTable)):
+            for array in [value.indptr, value.indices] + ([value.coefs] if isinstance(value, MoebiusTable) else []):
+                array.setflags(write=False)
+        frozen[key] = value
+    return intv, MappingProxyType(frozen)
+
+
+def join_intv(X, Y, n):
+    """
+    helper function to join two intervals
+    works for 2D commutative grid
+    """
+    # n will be the length of both X and Y 
+    Z = list(X)
+    for j in range(n):
+        Z[j] = (min(X[j][0], Y[j][0]), max(X[j][1], Y[j][1]))
+    for s in range(n):
+        if Z[s][1] > -1: break
+    for t in range(n-1, -1, -1):
+        if Z[t][1] > -1: break
+    if s < t and Z[s][1] < Z[s+1][1]:
+        Z[s] = (Z[s][0], Z[s][1]+1)
+    if s < t and Z[t][0] > Z[t-1][0]:
+        Z[t] = (Z[t][0]-1, Z[t][1])
+    return tuple(Z)
+
 
 class CommutativeGridPreCompute():
     # G_{m,n}
-    def __init__(self,m:int,n:int=2):
+    def __init__(self,m:int,n:int=2,lazy:bool=False):
         # m: horizontal length
         # n: height
         # n=2 for commutative ladder 
+        # lazy: keep the intervals and the covers as arrays only (IntervalArray, CoverTable),
+        #   without building the lists of tuples, e.g. for large m and save_binary
         self.m=m
         self.n=n
+        self.lazy=lazy
         #raise error if not 1<=m<=999 and 1<=n<=999
         if not (1<=m<=999 and 1<=n<=999):
             raise ValueError("m and n should be within [1,999]")
@@ -15,6 +473,7 @@ def __init__(self,m:int,n:int=2):
         self.variables={'cov':{},'c_ss':{}}
         self.cover_generator()
         self.c_ss_initializer()
+        self.moebius_generator()
 
     def get_intervals(self):
         return self.intv
@@ -37,76 +496,62 @@ def save_variables_to_file(self, dirpath):
         with open(filepath, "wb") as f:
             pickle.dump(self.variables, f)
     
+    def save_binary(self, dirpath):
+        """
+        Save the tables as integer arrays, to be memory-mapped by load_precomputed_binary:
+        intervals (number of intervals, n, 2), the covers in CSR format (cov_indptr, cov_indices),
+        and for n=2 the layout of c_ss (css_pair_offsets) and the Moebius table.
+        The files are written to a temporary directory first, then renamed.
+        """
+        path = precomputed_binary_path(dirpath, self.m, self.n)
+        arrays = {'intervals': self.intervals, 'cov_indptr': self.cov_indptr, 'cov_indices': self.cov_indices}
+        if self.n == 2:
+            moebius = self.variables['moebius']
+            arrays['css_pair_offsets'] = self.variables['c_ss'].pair_offsets
+            arrays['moebius_indptr'] = moebius.indptr
+            arrays['moebius_indices'] = moebius.indices
+            arrays['moebius_coefs'] = moebius.coefs
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({'version': PRECOMPUTED_FORMAT_VERSION, 'm': self.m, 'n': self.n, 'arrays': list(arrays)}, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+        return path
+
     def interval_generator(self):
-        """Generate intervals"""
-        n = self.n  # vertical height, use !n in debug mode
-        m = self.m  # horizontal length, 2 by default
-        intv = []
-        # will be a list of tuples.
-        for k in range(n):
-            for birth in range(m):
-                for death in range(birth, m):
-                    I = [(m, -1) for _ in range(k)]
-                    I.append((birth, death))
-                    intv.append(I)
-        i = 0
-        while(i < len(intv)):
-            I = intv[i]
-            if len(I) < n:
-                p, q = I[-1]
-                for b in range(p+1):
-                    for d in range(p, q+1):
-                        intv.append(I+[(b, d)])
-            I.extend([(m, -1) for _ in range(n-len(I))])
-            intv[i] = tuple(I)
-            i += 1
-        # intv.sort(key=self.sizeSupp)
+        """Generate intervals, see interval_array for the order"""
+        self.intervals = interval_array(self.m, self.n)
+        intv = IntervalArray(self.intervals)
+        if not self.lazy:
+            intv = list(intv)
         # print(f"全{str(len(intv))}個の区間表現を構築")
         print(f"Constructed all {str(len(intv))} interval representations")
         return intv
     
     def cover_generator(self):
-        """generate interval covers
-        some values of c_ss is initialized
-        """
-        cov = {} # will be a dict
-        n = self.n
-        m = self.m
-        for I in self.intv:
-            for s in range(n):
-                if I[s][1] > -1:
-                    break
-            for t in range(n-1, -1, -1):
-                if I[t][1] > -1:
-                    break
-            cov[I] = []  # cover
-            b = I[t][0]  # birth
-            d = I[s][1]  # death
-            if t < n-1:
-                L = list(I); L[t+1] = (b, b)
-                cov[I].append(tuple(L))
-            if s > 0:
-                L = list(I); L[s-1] = (d, d)
-                cov[I].append(tuple(L))
-            if b > 0:
-                L = list(I); L[t] = (b-1, I[t][1])
-                cov[I].append(tuple(L))
-            for j in range(t-1, s-1, -1):
-                if I[j+1][0] < I[j][0]:
-                    L = list(I); L[j] = (I[j][0]-1, I[j][1])
-                    cov[I].append(tuple(L))
-            if d < m-1:
-                L = list(I); L[s] = (I[s][0], d+1)
-                cov[I].append(tuple(L))
-            for j in range(s+1, t+1):
-                if I[j-1][1] > I[j][1]:
-                    L = list(I); L[j] = (I[j][0], I[j][1]+1)
-                    cov[I].append(tuple(L))
-
-        self.variables['cov']=cov
+        """generate interval covers, see cover_arrays for the order"""
+        self.cov_indptr, self.cov_indices = cover_arrays(self.intervals, self.m)
+        if self.lazy:
+            self.variables['cov'] = CoverTable(self.intv, self.cov_indptr, self.cov_indices)
+            return
+        covers = [self.intv[j] for j in self.cov_indices.tolist()]
+        bounds = self.cov_indptr.tolist()
+        self.variables['cov'] = {I: covers[bounds[i]:bounds[i+1]] for i, I in enumerate(self.intv)}
     
+    def moebius_generator(self):
+        """precompute the Moebius inversion of c_ss, commutative ladders only"""
+        if self.n == 2:
+            self.variables['moebius']=MoebiusTable.from_cover_arrays(self.intervals, self.cov_indptr, self.cov_indices, self.m)
+
     def c_ss_initializer(self):
         m=self.m
+        if self.n == 2:
+            self.variables['c_ss']=DenseCss(m)
+            return
         c_ss={}
         for I in self.intv:
             c_ss[I]=0
@@ -120,4 +565,4 @@ def c_ss_initializer(self):
         for i in range(m): 
             c_ss[((i, m), e)]=0
             c_ss[((-1, i), e)]=0
-        self.variables['c_ss']=c_ss
\ No newline at end of file
+        self.variables['c_ss']=c_ss
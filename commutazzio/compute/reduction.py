@@ -0,0 +1,143 @@
+"""
+Reduction of the complexes of a commutative ladder CL(m) before the zigzags are computed,
+without changing the connected persistence diagram.
+
+Each simplex s appears in the lower row from the column lo[s] on, in the upper row from the column up[s] on,
+with up[s] <= lo[s], and m when it never appears. Two reductions are applied to the ladder:
+
+1. The top simplices that kill nothing.
+    The complexes carry the simplices up to dimension dim+1, and the (dim+1)-simplices only matter
+    through their boundaries. In the persistence of each row, the negative (dim+1)-simplices,
+    the ones killing a dim-cycle, span the boundaries of every column of the row.
+    The (dim+1)-simplices that are negative in neither row are removed from all the nodes:
+    the cycles and the boundaries of dimension dim are unchanged at every node.
+
+2. Elementary collapses, done simultaneously at all the nodes.
+    A pair (sigma, tau) with tau a cofacet of sigma is free at a node where tau is the only cofacet of sigma,
+    removing it there does not change the homotopy type of the complex.
+    The pair is removed from the nodes where it is free and from the nodes below them,
+    i.e. the births of sigma and tau are delayed to the columns where sigma gets another cofacet, or to m.
+    Removing a pair may free the facets of sigma and tau, the collapses are repeated until none is left.
+
+In both cases the reduced complexes are still a ladder of inclusions, the inclusions into the original complexes
+commute with it and induce isomorphisms in homology up to dimension dim,
+so the persistence modules are isomorphic and the connected persistence diagram is unchanged.
+"""
+import gudhi
+
+
+def ladder_keys(C):
+    """
+    C[a][b]: the complexes of the ladder, a set of simplices (sorted tuples of vertices) at each node (a,b),
+        b=0 the lower row and b=1 the upper row
+    Returns the list of the simplices of the ladder, sorted by (number of vertices, vertices),
+    and the lists lo, up of the first column where each of them appears in the lower and the upper row.
+    """
+    m = len(C)
+    # the upper right node contains every simplex of the ladder
+    simplices = sorted(C[m-1][1], key=lambda x: (len(x), x))
+    index = {simplex: i for i, simplex in enumerate(simplices)}
+    lo, up = [m]*len(simplices), [m]*len(simplices)
+    for b, first in [(0, lo), (1, up)]:
+        previous = set()
+        for a in range(m):
+            for simplex in C[a][b] - previous:
+                first[index[simplex]] = a
+            previous = C[a][b]
+    return simplices, lo, up
+
+
+def negative_simplices(simplices, first, m, dim):
+    """
+    The (dim+1)-simplices killing a dim-cycle in the persistence (over GF(2)) of the row
+    where the simplex s appears from the column first[s] on.
+    """
+    st = gudhi.SimplexTree()
+    # faces come first in simplices, and they do not appear after their cofaces
+    for simplex, column in zip(simplices, first):
+        if column < m:
+            st.insert(list(simplex), filtration=column)
+    # min_persistence=-1 keeps the pairs born and killed in the same column
+    st.compute_persistence(homology_coeff_field=2, min_persistence=-1)
+    return {tuple(sorted(death)) for _, death in st.persistence_pairs() if len(death) == dim+2}
+
+
+def sparsify_top_simplices(simplices, lo, up, m, dim):
+    """
+    Remove, by setting lo and up to m, the (dim+1)-simplices negative in neither row.
+    Returns the number of simplices removed.
+    """
+    negatives = negative_simplices(simplices, up, m, dim) | negative_simplices(simplices, lo, m, dim)
+    removed = 0
+    for i, simplex in enumerate(simplices):
+        if len(simplex) == dim+2 and up[i] < m and simplex not in negatives:
+            lo[i] = up[i] = m
+            removed += 1
+    return removed
+
+
+def delayed_collapses(simplices, lo, up, m):
+    """
+    Collapse the free pairs of the ladder given by ladder_keys, lo and up are updated in place.
+    Only the collapses delaying the upper row are done: a simplex born later in the lower row only
+    is deleted and inserted again by more zigzags, which would make them longer.
+    Returns the number of collapses.
+    """
+    index = {simplex: i for i, simplex in enumerate(simplices)}
+    facets = [[index[s[:k]+s[k+1:]] for k in range(len(s))] if len(s) > 1 else [] for s in simplices]
+    cofacets = [[] for _ in simplices]
+    for i, facet_list in enumerate(facets):
+        for f in facet_list:
+            cofacets[f].append(i)
+    collapses = 0
+    # highest dimensions first
+    stack = list(range(len(simplices)))
+    while stack:
+        s = stack.pop()
+        u, l = up[s], lo[s]
+        if u == m:
+            continue
+        cof = [c for c in cofacets[s] if up[c] < m]
+        # tau, the cofacet born with s in the upper row, if it is the only one
+        born_with = [c for c in cof if up[c] == u]
+        if len(born_with) != 1:
+            continue
+        tau = born_with[0]
+        # s is free in a row until the column before its next cofacet comes
+        next_upper = min((up[c] for c in cof if c != tau), default=m)
+        next_lower = min((lo[c] for c in cof if c != tau), default=m)
+        if l < m and lo[tau] == l and next_lower > l:
+            # free in the lower row too, delayed in both rows
+            up[s] = up[tau] = next_upper
+            lo[s] = lo[tau] = next_lower
+        elif min(next_upper, l) > u:
+            # s stays in the lower row from the column l, it cannot be removed above it
+            up[s] = up[tau] = min(next_upper, l)
+        else:
+            continue
+        collapses += 1
+        stack.append(s)
+        stack.append(tau)
+        stack.extend(facets[s])
+        stack.extend(facets[tau])
+    return collapses
+
+
+def reduce_ladder(C, dim):
+    """
+    Reduce in place the complexes C[a][b] of the ladder, the homology up to dimension dim is preserved.
+    Returns the number of simplices removed from the upper right node.
+    """
+    m = len(C)
+    simplices, lo, up = ladder_keys(C)
+    old_lo, old_up = list(lo), list(up)
+    sparsify_top_simplices(simplices, lo, up, m, dim)
+    delayed_collapses(simplices, lo, up, m)
+    removed = 0
+    for simplex, l0, l1, u0, u1 in zip(simplices, old_lo, lo, old_up, up):
+        for a in range(l0, l1):
+            C[a][0].discard(simplex)
+        for a in range(u0, u1):
+            C[a][1].discard(simplex)
+        removed += u1 == m
+    return removed
@@ -2,7 +2,7 @@
 from .file_operations import * # create_directory, filepath_generator, pickle_save, pickle_load,pickle_load_latest, clean_all, read_data
 from .labelled_point_cloud import attach_level
 from .radius_tools import radii_generator, join_and_unique
-from .watch import timeit
+from .watch import timeit, PhaseStats
 from .joblib_progress import tqdm_joblib
 from .memory_tools import print_memory_usage,print_memory_usage_of_all_variables
 from .compressed_dict import CompressedDict, CompressedDictManager
\ No newline at end of file
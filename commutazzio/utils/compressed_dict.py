@@ -13,12 +13,16 @@ def _parallel_init(self, kv_pair):
         k, v = kv_pair
         return {k: self._compress(v)}
 
-    def __init__(self, data=None):
+    def __init__(self, data=None, executor=None):
+            # executor: an optional CLExecutor, its long-lived pool is used instead of starting a new one
             super().__init__()  # Initialize the underlying dictionary
             if data:
                 if isinstance(data, dict):
-                    with Pool(processes=8) as pool:
-                        results = pool.map(self._parallel_init, data.items())
+                    if executor is not None:
+                        results = executor.map(self._parallel_init, data.items())
+                    else:
+                        with Pool(processes=8) as pool:
+                            results = pool.map(self._parallel_init, data.items())
                     for r in results:
                         super().update(r)
                 elif isinstance(data, CompressedDict):
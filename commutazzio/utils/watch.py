@@ -1,5 +1,8 @@
+import sys
 import time
+import json
 import logging
+from contextlib import contextmanager
 
 def timeit(method):
     """
@@ -22,4 +25,80 @@ def wrapper(*args, **kw):
         #     print('%r  %2.2f s' % \
         #           (method.__name__, (te - ts)))
         return result
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+def peak_rss_mb():
+    """peak resident set size of this process so far, in MB, None where resource is not available (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024*1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class PhaseStats():
+    """
+    Per-phase report of a computation, cheap enough to be always on:
+    a few clock reads and one getrusage call per phase, one tuple per zigzag.
+
+        stats = PhaseStats()
+        with stats.phase('complexes') as record:
+            ...
+            record['items'] = number_of_simplices
+        stats.to_json('stats.json')
+
+    phases[name]: wall and cpu seconds (summed over the calls), calls, items,
+        and peak_rss_mb, the peak RSS of this process at the end of the phase.
+        The cpu time is the one of this process, the work done by worker processes
+        is in the durations of the pairs.
+    pairs: (b0, d1, length, seconds) of each zigzag, length is the number of simplices in the zigzag sequence
+    """
+    def __init__(self):
+        self.phases = {}
+        self.pairs = []
+
+    @contextmanager
+    def phase(self, name, items=None):
+        record = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'items': 0, 'peak_rss_mb': None})
+        if items is not None:
+            record['items'] += items
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall'] += time.perf_counter() - wall
+            record['cpu'] += time.process_time() - cpu
+            record['calls'] += 1
+            record['peak_rss_mb'] = peak_rss_mb()
+
+    def add_pair(self, b0, d1, length, seconds):
+        self.pairs.append((int(b0), int(d1), int(length), float(seconds)))
+
+    def to_dict(self):
+        durations = [pair[3] for pair in self.pairs]
+        return {'phases': {name: dict(record) for name, record in self.phases.items()},
+                'pairs': [dict(zip(('b0', 'd1', 'length', 'seconds'), pair)) for pair in self.pairs],
+                'pairs_total_seconds': sum(durations),
+                'pairs_max_seconds': max(durations, default=0.0),
+                'peak_rss_mb': peak_rss_mb()}
+
+    def to_json(self, filepath=None, **kwargs):
+        """the report as a JSON string, also written to filepath if given"""
+        text = json.dumps(self.to_dict(), **kwargs)
+        if filepath is not None:
+            with open(filepath, 'w') as f:
+                f.write(text)
+        return text
+
+    def __repr__(self):
+        lines = [f"{'phase':<16}{'wall (s)':>10}{'cpu (s)':>10}{'calls':>7}{'items':>12}{'peak RSS (MB)':>15}"]
+        for name, r in self.phases.items():
+            rss = '' if r['peak_rss_mb'] is None else f"{r['peak_rss_mb']:.1f}"
+            lines.append(f"{name:<16}{r['wall']:>10.3f}{r['cpu']:>10.3f}{r['calls']:>7}{r['items']:>12}{rss:>15}")
+        if self.pairs:
+            lines.append(f"{len(self.pairs)} zigzags, {sum(p[3] for p in self.pairs):.3f}s in total, "
+                         f"longest {max(p[2] for p in self.pairs)} simplices")
+        return '\n'.join(lines)
@@ -5,7 +5,8 @@
 from tqdm import tqdm
 import fire
 
-def precompute(m_threshold=80):
+def precompute(m_threshold=80, binary=True):
+    # binary: write the memory-mapped binary store (CommutativeGridPreCompute.save_binary), otherwise the pickle files
     n = 2
     # Determine the absolute path of the current file
     current_file_path = Path(__file__).resolve()
@@ -23,15 +24,18 @@ def precompute(m_threshold=80):
     for m in tqdm(range(1, m_threshold+1), desc="Processing"):
         start_time = time.time()
 
-        a = CGPC(m, n)
-        fn_intv = f"intv_{m:03d}_{n:03d}.pkl"
-        fn_variables = f"variables_{m:03d}_{n:03d}.pkl"
-        fp_intv = Path(dirname)/fn_intv
-        fp_variables = Path(dirname)/fn_variables
-        with open(fp_intv, "wb") as f:
-            pickle.dump(a.get_intervals(), f)
-        with open(fp_variables, "wb") as f:
-            pickle.dump(a.get_variables(), f)
+        a = CGPC(m, n, lazy=binary) # the binary store is written from the arrays, no tuples needed
+        if binary:
+            a.save_binary(dirname)
+        else:
+            fn_intv = f"intv_{m:03d}_{n:03d}.pkl"
+            fn_variables = f"variables_{m:03d}_{n:03d}.pkl"
+            fp_intv = Path(dirname)/fn_intv
+            fp_variables = Path(dirname)/fn_variables
+            with open(fp_intv, "wb") as f:
+                pickle.dump(a.get_intervals(), f)
+            with open(fp_variables, "wb") as f:
+                pickle.dump(a.get_variables(), f)
 
         end_time = time.time()
         duration = end_time - start_time
@@ -2,14 +2,23 @@
 from commutazzio.plot import ComplementaryTrianglesPlot as Visualizer1
 from commutazzio.utils import filepath_generator, delete_file
 import os
+import pytest
 
-def test_commutative_property_of_cPD():
-    # Set up test data and directories
-    l = 5
+
+@pytest.fixture
+def x_a():
+    """the filtration file X_a, with a ladder length and filtration values where its cPD has a line"""
     radii = [1.5, 1.731, 1.733, 1.999, 2.001]
     test_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(test_dir, "test_fixtures/X_a.fltr"), len(radii), radii
+
+
+def test_commutative_property_of_cPD(x_a):
+    # Set up test data and directories
+    fp, l, radii = x_a
+    test_dir = os.path.dirname(os.path.abspath(__file__))
     # Load filtration data
-    Da = cPD(os.path.join(test_dir, "test_fixtures/X_a.fltr"), ladder_length=l, homology_dim=1, filtration_values=radii, clean_up=True)
+    Da = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii, clean_up=True)
     Db = cPD(os.path.join(test_dir, "test_fixtures/X_b.fltr"), ladder_length=l, homology_dim=1, filtration_values=radii, clean_up=True)
     # Check that computations are correct
     assert Da.lines.multiplicity.values[0] == 1
@@ -22,4 +31,288 @@ def test_commutative_property_of_cPD():
     Va.render_and_export_figure(filename=fpa,export_mode='full_html')
     Vb.render_and_export_figure(filename=fpb,export_mode='full_html')
     delete_file(fpa)
-    delete_file(fpb)
\ No newline at end of file
+    delete_file(fpb)
+
+def test_schedule_jobs():
+    jobs = ['a', 'b', 'c', 'd', 'e']
+    costs = [1, 10, 2, 8, 1]
+    batches = cPD.schedule_jobs(jobs, costs, num_workers=2, batches_per_worker=2)
+    # longest first, cheap jobs grouped together
+    assert batches == [['b'], ['d'], ['c', 'a', 'e']]
+    assert sorted(sum(batches, [])) == sorted(jobs)
+
+
+def test_index_aligner():
+    assert cPD._index_aligner([3, 2, 0, 4]).tolist() == [0, 3, 5, 5, 9, 10]
+
+
+def test_cPD_from_clfiltration(tmp_path):
+    import numpy as np
+    from commutazzio.filtration import pointCloud2Filtration
+    rng = np.random.default_rng(0)
+    radii = [0.1, 0.15, 0.2, 0.25, 0.3]
+    clf = pointCloud2Filtration(rng.random((20, 2)), [1, 5, 7], radii, 2, method='rips')
+    fp = clf.random_cech_format_output_file(new_file=False, filepath=str(tmp_path / 'X.fltr'))
+    for dim in (0, 1):
+        D_file = cPD(fp, ladder_length=5, homology_dim=dim, filtration_values=radii)
+        # the ladder length and the filtration values are those of clf
+        D_clf = cPD(clf=clf, homology_dim=dim)
+        assert D_clf.dec == D_file.dec
+        assert D_clf.dotdec == D_file.dotdec
+    with pytest.raises(TypeError):
+        cPD(clf, ladder_length=5, homology_dim=1, filtration_values=radii)
+
+
+def test_read_filtration_file(tmp_path):
+    fp = tmp_path / 'X.fltr'
+    fp.write_text("# dim birth n m v_0 .. v_dim (CECH_RANDOM)\n"
+                  "0 1.0 0 0 3\n0 1.0 1 0 1\n1 2.0 0 1 3 1\n2 2.0 1 1 1 3 0\n"
+                  "0 2.5 1 2 2\n1 9.0 0 3 0 2\n0 9.0 0 3 5\n")
+    times = [1.0, 2.0, 2.5]
+    for chunk_rows in (1, 3, 1 << 20):
+        parsed = [(x.tolist(), y.tolist(), v.tolist()) for x, y, v in
+                  cPD.read_filtration_file(str(fp), 1, times, chunk_rows=chunk_rows)]
+        simplices = sorted((x_, y_, tuple(v_)) for x, y, v in parsed for x_, y_, v_ in zip(x, y, v))
+        # the triangle is above max_dim, parsing stops at the first birth after the last time
+        assert simplices == [(0, 0, (3,)), (0, 1, (1,)), (1, 0, (1, 3)), (2, 1, (2,))]
+
+
+def test_multi_dimension_cPD(x_a):
+    fp, l, radii = x_a
+    D = cPD(fp, ladder_length=l, homology_dim=[0, 1], filtration_values=radii)
+    for dim in (0, 1):
+        D_single = cPD(fp, ladder_length=l, homology_dim=dim, filtration_values=radii)
+        assert D.diagrams[dim].dim == dim
+        assert D.diagrams[dim].dec == D_single.dec
+        assert D.diagrams[dim].dotdec == D_single.dotdec
+        assert D.diagrams[dim].lines.equals(D_single.lines)
+    # the parent has no plot data of its own
+    for name in ['plot_data', 'dots', 'lines']:
+        with pytest.raises(ValueError, match=rf"diagrams\[dim\]\.{name}"):
+            getattr(D, name)
+
+
+def test_cPD_checkpoint(x_a, tmp_path):
+    fp, l, radii = x_a
+    D = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii, checkpoint_dir=str(tmp_path), clean_up=False)
+    assert len(os.listdir(tmp_path)) == 1
+    # resumed from the complete checkpoint
+    D_resumed = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii, checkpoint_dir=str(tmp_path))
+    assert D_resumed.dec == D.dec
+    assert len(os.listdir(tmp_path)) == 0
+
+
+def _worker_attached():
+    from commutazzio.compute import connected_persistence_diagram
+    return connected_persistence_diagram._worker_deltas is not None
+
+
+def test_cPD_executor(x_a):
+    from commutazzio.compute import CLExecutor
+    fp, l, radii = x_a
+    fixtures = os.path.dirname(fp)
+    D = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii)
+    # the same pool serves several diagrams
+    with CLExecutor(num_cores=2) as executor:
+        assert len(set(executor.broadcast(os.getpid))) == executor.num_cores
+        for fn in ["X_a.fltr", "X_b.fltr", "X_a.fltr"]:
+            D_ex = cPD(os.path.join(fixtures, fn), ladder_length=l, homology_dim=1, filtration_values=radii, executor=executor)
+            # the workers released the delta store at the end of the diagram
+            assert not any(executor.broadcast(_worker_attached))
+    assert D_ex.dec == D.dec
+
+
+def test_cPD_threads_backend(x_a):
+    fp, l, radii = x_a
+    D = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii)
+    D_threads = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii, enable_multi_processing=True, num_cores=2, backend='threads')
+    assert D_threads.dec == D.dec
+    with pytest.raises(ValueError):
+        cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii, backend='fibers')
+
+
+def test_batch_cPD(x_a):
+    from commutazzio.compute import batch_cPD
+    fp, l, radii = x_a
+    fixtures = os.path.dirname(fp)
+    fps = [os.path.join(fixtures, fn) for fn in ["X_a.fltr", "X_b.fltr", "X_a.fltr"]]
+    expected = [cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii).dec for fp in fps]
+    for backend in ['processes', 'threads']:
+        results = dict(batch_cPD(fps, homology_dim=1, ladder_length=l, filtration_values=radii, num_cores=2, backend=backend, max_pending=2))
+        assert [results[i].dec for i in range(len(fps))] == expected
+    from commutazzio.compute import CLExecutor
+    with CLExecutor(num_cores=2) as executor:
+        results = dict(batch_cPD(fps, homology_dim=1, ladder_length=l, filtration_values=radii, executor=executor, max_pending=2))
+        assert [results[i].dec for i in range(len(fps))] == expected
+        assert not any(executor.broadcast(_worker_attached))
+
+
+def test_dots_and_lines(x_a):
+    fp, l, radii = x_a
+    D = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii)
+    assert list(D.dots.columns) == ['x', 'y', 'multiplicity', 'area']
+    assert list(D.lines.columns) == ['x0', 'y0', 'x1', 'y1', 'multiplicity']
+    # every dot carries the multiplicity of dotdec
+    for x, y, mult, area in D.dots.itertuples(index=False):
+        key = f"{y-1},{x-1},{l},-1" if area == 'D' else f"{l},-1,{x-1},{y-1}"
+        assert D.dotdec[key] == mult
+    assert sum(D.dotdec.values()) == 2*sum(D.dec.values())
+    # the csv texts are formatted once
+    assert D.plot_data['dots'] is D.plot_data['dots']
+
+
+def test_precomputed_cache(x_a):
+    from commutazzio.compute.connected_persistence_diagram import precomputed_tables
+    fp, l, radii = x_a
+    fixtures = os.path.dirname(fp)
+    precomputed_tables.cache_clear()
+    # the columns of X_a at 1.5 and 1.731 are merged, only the tables of the original length are loaded
+    Da = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii)
+    Db = cPD(os.path.join(fixtures, "X_b.fltr"), ladder_length=l, homology_dim=1, filtration_values=radii)
+    assert len(Da.column_groups) < l
+    info = precomputed_tables.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+    assert Da.intv is Db.intv
+    # the shared template is left untouched, each diagram fills its own c_ss
+    template = precomputed_tables(l, 2)[1]['c_ss']
+    assert not template.values.any()
+    assert Da.variables['c_ss'] is not template and Da.variables['c_ss'].values.any()
+    with pytest.raises(ValueError):
+        template.values[0] = 1
+
+
+def test_cPD_stream(x_a):
+    fp, l, radii = x_a
+    D = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii)
+    D_stream = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii, deferred=True)
+    assert D_stream.partial_dec() == {}
+    kinds = []
+    for kind, data in D_stream.stream():
+        kinds.append(kind)
+        partial = D_stream.partial_dec()
+        # what is final never changes afterwards
+        assert all(D.dec.get(key, 0) == mult for key, mult in partial.items())
+        if kind == 'rows':
+            assert data['upper'][1].sum() > 0
+    assert kinds[:2] == ['rows', 'boundary'] and kinds[-1] == 'done'
+    assert kinds.count('pair') > 0
+    assert D_stream.dec == D.dec and D_stream.partial_dec() == D.dec
+    events = []
+    D_callback = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii, progress_callback=lambda kind, data: events.append(kind))
+    assert events == kinds and D_callback.dec == D.dec
+
+
+def test_cPD_stream_closed_early(x_a, tmp_path):
+    fp, l, radii = x_a
+    D = cPD(fp, ladder_length=l, homology_dim=0, filtration_values=radii)
+    D_stream = cPD(fp, ladder_length=l, homology_dim=0, filtration_values=radii, deferred=True, checkpoint_dir=str(tmp_path))
+    events = D_stream.stream()
+    for kind, data in events:
+        if kind == 'pair':
+            break
+    events.close()
+    checkpoint = D_stream._deco_state['checkpoint']
+    assert checkpoint._fd is None and os.path.exists(checkpoint.filepath)
+    # the rows and the first pair are resumed, the other pairs are computed
+    D_resumed = cPD(fp, ladder_length=l, homology_dim=0, filtration_values=radii, checkpoint_dir=str(tmp_path))
+    assert len(D_resumed.stats.pairs) == len(D.stats.pairs)-1
+    assert 'upper_barcode' not in D_resumed.stats.phases
+    assert D_resumed.dec == D.dec
+    assert len(os.listdir(tmp_path)) == 0
+
+
+def test_cPD_stats(x_a, tmp_path):
+    import json
+    fp, l, radii = x_a
+    D = cPD(fp, ladder_length=l, homology_dim=1, filtration_values=radii)
+    phases = ['complexes', 'compression', 'encoding', 'upper_barcode', 'lower_barcode', 'pairs', 'moebius', 'output']
+    assert list(D.stats.phases) == phases
+    assert all(D.stats.phases[name]['calls'] == 1 for name in phases)
+    assert D.stats.phases['pairs']['items'] == len(D.stats.pairs) > 0
+    assert D.stats.phases['output']['items'] == len(D.dec)
+    assert all(length > 0 and seconds >= 0 for _, _, length, seconds in D.stats.pairs)
+    report = json.loads(D.stats.to_json(tmp_path / "stats.json"))
+    assert report == json.loads((tmp_path / "stats.json").read_text())
+    assert len(report['pairs']) == len(D.stats.pairs)
+
+
+def test_cPD_compress_columns(x_a):
+    # the filtration values of X_a are 0, 1, 1.732 and 2, nothing changes between the radii of a run
+    fp = x_a[0]
+    radii = [0.5, 0.6, 1.5, 1.8, 1.9, 1.95, 2.5, 2.6]
+    for dim in (0, 1):
+        D = cPD(fp, ladder_length=len(radii), homology_dim=dim, filtration_values=radii, compress_columns=False)
+        D_compressed = cPD(fp, ladder_length=len(radii), homology_dim=dim, filtration_values=radii)
+        # in dimension 0 the triangles appearing at 2 are left out
+        assert D_compressed.column_groups == ([(0, 1), (2, 2), (3, 5), (6, 7)] if dim == 1 else [(0, 1), (2, 2), (3, 7)])
+        assert len(D_compressed.stats.pairs) < len(D.stats.pairs)
+        assert D_compressed.m == D.m == len(radii)
+        assert D_compressed.dec == D.dec
+        assert D_compressed.dotdec == D.dotdec
+        assert D_compressed.lines.equals(D.lines)
+        assert D_compressed.variables['c_ss'].values.tolist() == D.variables['c_ss'].values.tolist()
+
+
+def test_cPD_same_zigzag_sequences(tmp_path, monkeypatch):
+    from commutazzio.compute.delta_store import LadderDeltaStore
+    # the upper row is a square from the start, the lower row fills it in later, so the upper row never changes
+    # and the pairs (b0,d1) with the same b0 have the same zigzag sequence
+    lines = ["0 0.000 1 0 0", "0 0.000 1 0 1", "0 0.000 1 0 2", "0 0.000 1 0 3",
+             "1 0.000 1 0 0 1", "1 0.000 1 0 1 2", "1 0.000 1 0 2 3", "1 0.000 1 0 0 3",
+             "0 1.000 0 1 0", "0 1.000 0 1 1", "0 2.000 0 2 2", "1 2.000 0 2 0 1", "1 2.000 0 2 1 2",
+             "0 3.000 0 3 3", "1 3.000 0 3 2 3", "1 3.000 0 3 0 3"]
+    fp = tmp_path / "square.fltr"
+    fp.write_text("\n".join(lines) + "\n")
+    radii = [0, 1, 2, 3]
+    D = cPD(str(fp), ladder_length=4, homology_dim=0, filtration_values=radii)
+    assert len(D.column_groups) == 4
+    # every pair computed separately
+    with monkeypatch.context() as patch:
+        patch.setattr(LadderDeltaStore, 'pair_key', lambda self, b0, d1: (b0, d1))
+        D_all = cPD(str(fp), ladder_length=4, homology_dim=0, filtration_values=radii)
+    assert len(D.stats.pairs) == 3 and len(D_all.stats.pairs) == 6
+    assert D.dec == D_all.dec and D.dotdec == D_all.dotdec
+
+
+def test_cPD_extend():
+    import numpy as np
+    from commutazzio.filtration import pointCloud2Filtration
+    rng = np.random.default_rng(5)
+    # the last column is the same as the one before, it is merged with it
+    radii = [float(r) for r in np.linspace(0.1, 0.3, 9)] + [0.3001]
+    clf = pointCloud2Filtration(rng.random((60, 2)), list(range(0, 60, 2)), radii, 2, method='rips')
+    D = cPD(clf=clf, ladder_length=8, homology_dim=[1], filtration_values=radii[:8], extendable=True)
+    for k in (8, 9):
+        # the simplices appearing at the column k in each row, the filtration values of a CLFiltration are 1,2,...
+        upper, lower = [[s for s, fv in tree.get_filtration() if round(fv) == k+1] for tree in (clf.upper, clf.lower)]
+        pairs_before = len(D.stats.pairs)
+        D.extend(upper, lower, radii[k])
+        D_full = cPD(clf=clf, ladder_length=k+1, homology_dim=[1], filtration_values=radii[:k+1])
+        assert D.m == k+1 and D.column_groups == D_full.column_groups
+        # the stored barcodes are reused, only the zigzags of the new column are computed
+        assert len(D.stats.pairs) - pairs_before == (1 if k == 8 else 0) and len(D_full.stats.pairs) == 7
+        assert D.diagrams[1].dec == D_full.diagrams[1].dec
+        assert D.diagrams[1].dotdec == D_full.diagrams[1].dotdec
+    with pytest.raises(ValueError):
+        cPD(clf=clf, ladder_length=3, homology_dim=1, filtration_values=radii[:3]).extend([], [], radii[3])
+
+
+def test_cPD_restrict():
+    import numpy as np
+    from commutazzio.filtration import pointCloud2Filtration
+    rng = np.random.default_rng(2)
+    radii = [0.1, 0.13, 0.16, 0.19, 0.22, 0.25, 0.28]
+    clf = pointCloud2Filtration(rng.random((30, 2)), list(range(0, 30, 3)), radii, 2, method='rips')
+    D = cPD(clf=clf, ladder_length=7, homology_dim=[0, 1], filtration_values=radii)
+    for indices in [(0, 4, 6), (1, 3, 6), (2,), (0, 1, 2, 3, 4, 5, 6)]:
+        D_restricted = D.restrict(indices)
+        assert len(D_restricted.stats.pairs) == 0
+        # the same ladder, computed from scratch
+        clf_resampled = clf.resample_filtration(len(indices), [i+1 for i in indices]) if len(indices) < 7 else clf
+        D_resampled = cPD(clf=clf_resampled, ladder_length=len(indices), homology_dim=[0, 1], filtration_values=[radii[i] for i in indices])
+        for dim in (0, 1):
+            assert D_restricted.diagrams[dim].dec == D_resampled.diagrams[dim].dec
+            assert D_restricted.diagrams[dim].dotdec == D_resampled.diagrams[dim].dotdec
+            assert D_restricted.diagrams[dim].variables['c_ss'].values.tolist() == D_resampled.diagrams[dim].variables['c_ss'].values.tolist()
+    with pytest.raises(ValueError):
+        D.restrict([3, 2])
@@ -0,0 +1,24 @@
+import os
+import numpy as np
+from commutazzio.compute.checkpoint import BarcodeCheckpoint
+
+
+def test_checkpoint_resume(tmp_path):
+    checkpoint = BarcodeCheckpoint(str(tmp_path), 'abc')
+    checkpoint.append(BarcodeCheckpoint.UPPER, [(0, 1, 5), (1, 2, 3)])
+    checkpoint.append((0, 2), [])
+    checkpoint.append((1, 2), [(0, 4, 9)])
+    checkpoint.close()
+    # a crash in the middle of the last record
+    size = os.path.getsize(checkpoint.filepath)
+    with open(checkpoint.filepath, 'r+b') as f:
+        f.truncate(size-5)
+    done = BarcodeCheckpoint(str(tmp_path), 'abc').load()
+    assert sorted(done) == [BarcodeCheckpoint.UPPER, (0, 2)]
+    assert done[BarcodeCheckpoint.UPPER].tolist() == [[0, 1, 5], [1, 2, 3]]
+    assert done[(0, 2)].shape == (0, 3)
+    # the incomplete record is dropped, the next ones are appended after the complete ones
+    checkpoint = BarcodeCheckpoint(str(tmp_path), 'abc')
+    checkpoint.append((1, 2), np.array([[0, 4, 9]]))
+    checkpoint.remove()
+    assert not os.path.exists(checkpoint.filepath)
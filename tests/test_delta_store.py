@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from commutazzio.compute.delta_store import LadderDeltaStore
+
+# CL(3): simplex IDs 0..5
+simplices = [[0], [1], [2], [0, 1], [1, 2], [0, 2]]
+nodes = [[0], [0, 1]]  # (0,0), (0,1)
+steps = [[[1], [2, 4]],  # lower row: (0,0)->(1,0), (1,0)->(2,0)
+         [[2, 3], [4, 5]]]  # upper row: (0,1)->(1,1), (1,1)->(2,1)
+verticals = [[1], [2, 3], [3, 5]]
+
+
+def test_path_composition():
+    store = LadderDeltaStore(nodes, steps, verticals, simplices)
+    ids, ops = store[(0, 1, 2, 1)]
+    assert ids.tolist() == [2, 3, 4, 5] and ops.all()
+    ids, ops = store[(2, 1, 0, 1)]
+    assert ids.tolist() == [5, 4, 3, 2] and not ops.any()
+    ids, ops = store[(0, 0, 1, 1)]
+    assert ids.tolist() == [1, 2, 3] and ops.all()
+    ids, ops = store[(2, 1, 1, 0)]
+    assert ids.tolist() == [5, 4, 3, 2] and not ops.any()
+    assert store.length(0, 1, 2, 1) == 4
+    assert store.length(1, 0, 1, 0) == 0
+
+
+def test_pair_segments():
+    store = LadderDeltaStore(nodes, steps, verticals, simplices)
+    filt_simps, filt_ops = store.to_filts(store.pair_segments(1, 1))
+    # (0,1) -> (1,1) -> (1,0) -> (2,0)
+    assert filt_simps == [[0], [1], [2], [0, 1], [0, 1], [2], [2], [1, 2]]
+    assert filt_ops == [True, True, True, True, False, False, True, True]
+    # every complex along the zigzag is the corresponding node of the ladder
+    ids, ops = store.join(store.node(2, 1))
+    assert np.array_equal(np.sort(ids), np.arange(6))
+
+
+def test_pair_length():
+    store = LadderDeltaStore(nodes, steps, verticals, simplices)
+    assert store.pair_length(1, 1) == 8
+
+
+def test_share_attach_roundtrip():
+    store = LadderDeltaStore(nodes, steps, verticals, simplices)
+    shm, handle = store.share()
+    try:
+        attached = LadderDeltaStore.attach(handle)
+        assert attached.complexes() == store.complexes()
+        assert attached.fingerprint() == store.fingerprint()
+        assert attached.to_filts(attached.pair_segments(1, 1)) == store.to_filts(store.pair_segments(1, 1))
+        # the arrays are views on the shared block, workers must not write into them
+        for array in attached._arrays.values():
+            assert not array.flags.writeable
+        with pytest.raises(ValueError):
+            attached.rows[0][0] = 0
+        attached.detach()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_encoding_by_hand():
+    # CL(3) with an empty vertical step at a=1, simplex IDs 0..4
+    #   (0,1)={0,1}   (1,1)={0,1,3}   (2,1)={0,1,2,3,4}
+    #   (0,0)={0}     (1,0)={0,1,3}   (2,0)={0,1,2,3}
+    store = LadderDeltaStore([[0], [0, 1]], [[[1, 3], [2]], [[3], [2, 4]]], [[1], [], [4]],
+                             [[0], [1], [2], [0, 1], [1, 2]])
+    as_lists = lambda segments: [(ids.tolist(), ops.tolist()) for ids, ops in segments]
+    assert as_lists(store.segments(0, 0, 2, 0)) == [([1, 3, 2], [True]*3)]
+    # deletions run backwards through the insertion order
+    assert as_lists(store.segments(2, 0, 0, 0)) == [([2, 3, 1], [False]*3)]
+    assert as_lists(store.segments(0, 0, 1, 1)) == [([1, 3], [True]*2), ([], [])]
+    assert as_lists(store.segments(2, 1, 1, 0)) == [([4, 2], [False]*2), ([], [])]
+    with pytest.raises(ValueError):
+        store.segments(1, 0, 0, 1)
+    # (0,1) -> (2,1) -> (1,1)=(1,0) -> (2,0)
+    assert as_lists(store.pair_segments(1, 2)) == [([0, 1], [True]*2), ([], []), ([3, 2, 4], [True]*3),
+                                                   ([4, 2], [False]*2), ([], []), ([2], [True])]
+    filt_simps, filt_ops = store.to_filts(store.pair_segments(1, 2))
+    assert filt_simps == [[0], [1], [0, 1], [2], [1, 2], [1, 2], [2], [2]]
+    assert filt_ops == [True]*5 + [False]*2 + [True]
+    assert store.pair_key(1, 2)[2] is None
+    assert store.to_filts(store.segments(1, 0, 1, 1)) == ([], [])
@@ -0,0 +1,124 @@
+import numpy as np
+from commutazzio.compute.precompute import CommutativeGridPreCompute, DenseCss, join_intv, load_precomputed_binary
+
+
+def test_dense_css():
+    m = 4
+    c_ss = CommutativeGridPreCompute(m, 2).get_variables()['c_ss']
+    assert isinstance(c_ss, DenseCss)
+    e = (m, -1)
+    d_ss = np.triu(np.arange(1, m*m+1).reshape(m, m))
+    c_ss.upper[1:m+1, 1:m+1] = c_ss.ss_cumsum(d_ss)
+    # the recurrence c[b,d] = d_ss[b,d] + c[b-1,d] + c[b,d+1] - c[b-1,d+1]
+    for b in range(m):
+        for d in range(b, m):
+            assert c_ss[(e, (b, d))] == d_ss[b, d] + c_ss[(e, (b-1, d))] + c_ss[(e, (b, d+1))] - c_ss[(e, (b-1, d+1))]
+    c_ss.pair(1, 2)[...] = 7
+    assert c_ss[((1, 3), (0, 2))] == 7
+    assert c_ss[((1, m), (0, 2))] == 0 and c_ss[((1, 3), (-1, 2))] == 0
+    assert c_ss[((1, 2), (0, 1))] == 0
+
+
+def test_moebius_table():
+    m = 5
+    pre = CommutativeGridPreCompute(m, 2)
+    variables = pre.get_variables()
+    c_ss = variables['c_ss']
+    c_ss.values[:] = np.random.default_rng(0).integers(0, 100, len(c_ss.values))
+    c_ss.values[0] = 0 # padding used for the sentinels
+    delt_ss = variables['moebius'].apply(c_ss)
+    for i, I in enumerate(pre.get_intervals()):
+        cov = variables['cov'][I]
+        expected = 0
+        for s in range(1 << len(cov)):
+            js = I
+            for j in range(len(cov)):
+                if (1 << j) & s:
+                    js = join_intv(js, cov[j], 2)
+            expected += (-1)**bin(s).count('1') * c_ss[js]
+        assert delt_ss[i] == expected
+
+
+def test_precomputed_binary(tmp_path):
+    m = 4
+    pre = CommutativeGridPreCompute(m, 2)
+    pre.save_binary(str(tmp_path))
+    assert load_precomputed_binary(str(tmp_path), m+1) is None
+    intv, variables = load_precomputed_binary(str(tmp_path), m)
+    assert isinstance(intv.array, np.memmap)
+    assert list(intv) == pre.get_intervals()
+    assert intv[3] == pre.get_intervals()[3]
+    for I in pre.get_intervals():
+        assert variables['cov'][I] == pre.get_variables()['cov'][I]
+    c_ss = variables['c_ss']
+    c_ss.values[:] = np.random.default_rng(0).integers(0, 100, len(c_ss.values))
+    c_ss.values[0] = 0
+    assert (variables['moebius'].apply(c_ss) == pre.get_variables()['moebius'].apply(c_ss)).all()
+
+
+def _reference_intervals_and_covers(m, n):
+    """the original generators of CommutativeGridPreCompute, with Python lists and tuples"""
+    intv = []
+    for k in range(n):
+        for birth in range(m):
+            for death in range(birth, m):
+                I = [(m, -1) for _ in range(k)]
+                I.append((birth, death))
+                intv.append(I)
+    i = 0
+    while(i < len(intv)):
+        I = intv[i]
+        if len(I) < n:
+            p, q = I[-1]
+            for b in range(p+1):
+                for d in range(p, q+1):
+                    intv.append(I+[(b, d)])
+        I.extend([(m, -1) for _ in range(n-len(I))])
+        intv[i] = tuple(I)
+        i += 1
+    cov = {}
+    for I in intv:
+        for s in range(n):
+            if I[s][1] > -1:
+                break
+        for t in range(n-1, -1, -1):
+            if I[t][1] > -1:
+                break
+        cov[I] = []
+        b = I[t][0]
+        d = I[s][1]
+        if t < n-1:
+            L = list(I); L[t+1] = (b, b)
+            cov[I].append(tuple(L))
+        if s > 0:
+            L = list(I); L[s-1] = (d, d)
+            cov[I].append(tuple(L))
+        if b > 0:
+            L = list(I); L[t] = (b-1, I[t][1])
+            cov[I].append(tuple(L))
+        for j in range(t-1, s-1, -1):
+            if I[j+1][0] < I[j][0]:
+                L = list(I); L[j] = (I[j][0]-1, I[j][1])
+                cov[I].append(tuple(L))
+        if d < m-1:
+            L = list(I); L[s] = (I[s][0], d+1)
+            cov[I].append(tuple(L))
+        for j in range(s+1, t+1):
+            if I[j-1][1] > I[j][1]:
+                L = list(I); L[j] = (I[j][0], I[j][1]+1)
+                cov[I].append(tuple(L))
+    return intv, cov
+
+
+def test_vectorised_generator():
+    from commutazzio.compute.precompute import MoebiusTable
+    for m, n in [(1, 2), (2, 2), (5, 2), (7, 2), (4, 1), (4, 3), (3, 4)]:
+        pre = CommutativeGridPreCompute(m, n)
+        intv, cov = _reference_intervals_and_covers(m, n)
+        assert pre.get_intervals() == intv
+        assert list(pre.get_variables()['cov'].items()) == list(cov.items())
+        if n == 2:
+            moebius = pre.get_variables()['moebius']
+            reference = MoebiusTable.from_covers(intv, cov, m)
+            for name in ['indptr', 'indices', 'coefs']:
+                assert np.array_equal(getattr(moebius, name), getattr(reference, name))
@@ -0,0 +1,33 @@
+import numpy as np
+from commutazzio.compute import ConnectedPersistenceDiagram as cPD
+from commutazzio.compute.reduction import reduce_ladder
+from commutazzio.filtration import pointCloud2Filtration
+
+
+def test_reduce_ladder():
+    # a filled triangle in the upper row from the column 0, its boundary in the lower row from the column 1
+    triangle = {(0,), (1,), (2,), (0, 1), (0, 2), (1, 2), (0, 1, 2)}
+    boundary = triangle - {(0, 1, 2)}
+    C = [[set(), set(triangle)], [set(boundary), set(triangle)]]
+    assert reduce_ladder(C, 1) == 0
+    # the cycle of the lower row is filled in the upper row, the triangle stays,
+    # the upper row is a point until the column 1
+    assert len(C[0][1]) == 1 and C[1][1] == triangle and C[1][0] == boundary
+    # nothing in the lower row, the triangle collapses to a point
+    C = [[set(), set(triangle)], [set(), set(triangle)]]
+    assert reduce_ladder(C, 1) == 6
+    assert C[0][0] == C[1][0] == set() and C[0][1] == C[1][1] and len(C[1][1]) == 1
+
+
+def test_cPD_reduce_complexes():
+    rng = np.random.default_rng(0)
+    radii = [0.1, 0.15, 0.2, 0.25, 0.3]
+    clf = pointCloud2Filtration(rng.random((30, 2)), [1, 5, 7, 11], radii, 2, method='rips')
+    D = cPD(clf=clf, ladder_length=5, homology_dim=[0, 1], filtration_values=radii)
+    D_reduced = cPD(clf=clf, ladder_length=5, homology_dim=[0, 1], filtration_values=radii, reduce_complexes=True)
+    assert D_reduced.stats.phases['reduction']['items'] > 0
+    for dim in (0, 1):
+        assert D_reduced.diagrams[dim].dec == D.diagrams[dim].dec
+        assert D_reduced.diagrams[dim].dotdec == D.diagrams[dim].dotdec
+    # the zigzags are shorter
+    assert sum(p[2] for p in D_reduced.stats.pairs) < sum(p[2] for p in D.stats.pairs)
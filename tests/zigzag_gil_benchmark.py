@@ -0,0 +1,93 @@
+# Does the zigzag backend release the GIL during the reduction?
+# Two measurements for each available backend (fzzpy, dionysus):
+#   1. ticker: a pure Python thread counts while a zigzag is computed in another thread.
+#      If the GIL is held during the whole computation, the ticker is starved (ratio close to 0),
+#      if it is released, the ticker runs as fast as when it is alone (ratio close to 1,
+#      or close to 0.5 on a single core, where both threads share the core).
+#      This works even on a single core.
+#   2. speedup: the same batch of zigzags on 1 thread and on k threads,
+#      close to 1 when the GIL is held, close to min(k, number of cores) when it is released.
+# Usage: python zigzag_gil_benchmark.py [num_points] [num_threads]
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import gudhi
+
+
+def zigzag_input(num_points, seed=0):
+    """insert a Rips complex, remove its last third, insert it back"""
+    pts = np.random.default_rng(seed).random((num_points, 2))
+    st = gudhi.RipsComplex(points=pts, max_edge_length=0.3).create_simplex_tree(max_dimension=2)
+    simplices = [s for s, fv in st.get_filtration()]
+    removed = simplices[2*len(simplices)//3:]
+    filt_simps = simplices + removed[::-1] + removed
+    filt_ops = [True]*len(simplices) + [False]*len(removed) + [True]*len(removed)
+    return filt_simps, filt_ops
+
+
+def backends():
+    found = {}
+    try:
+        from fzzpy import compute
+        found['fzzpy'] = lambda simps, ops: compute(simps, ops, algorithm='chunk_reduction')
+    except ImportError:
+        pass
+    try:
+        import dionysus as d
+        def dionysus_zigzag(simps, ops):
+            # dionysus takes every simplex once, with the list of its insertion and deletion times
+            times = {}
+            for i, s in enumerate(simps):
+                times.setdefault(tuple(s), []).append(i)
+            keys = list(times)
+            f = d.Filtration([list(s) for s in keys])
+            return d.zigzag_homology_persistence(f, [times[s] for s in keys])
+        found['dionysus'] = dionysus_zigzag
+    except ImportError:
+        pass
+    return found
+
+
+def ticker_ratio(run, duration):
+    """ticks per second of a Python thread while run() executes, relative to the ticks alone"""
+    def ticks_during(target):
+        count = [0]
+        stop = threading.Event()
+        def tick():
+            while not stop.is_set():
+                count[0] += 1
+        t = threading.Thread(target=tick)
+        start = time.perf_counter()
+        t.start()
+        target()
+        stop.set()
+        t.join()
+        return count[0] / (time.perf_counter() - start)
+    alone = ticks_during(lambda: time.sleep(duration))
+    return ticks_during(run) / alone
+
+
+def main(num_points=60, num_threads=4, repeats=8):
+    filt_simps, filt_ops = zigzag_input(num_points)
+    print(f"zigzag of length {len(filt_simps)}, {num_threads} threads, {repeats} runs")
+    for name, compute in backends().items():
+        start = time.perf_counter()
+        compute(filt_simps, filt_ops)
+        one_run = time.perf_counter() - start
+        ratio = ticker_ratio(lambda: compute(filt_simps, filt_ops), one_run)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            compute(filt_simps, filt_ops)
+        sequential = time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=num_threads) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda _: compute(filt_simps, filt_ops), range(repeats)))
+            threaded = time.perf_counter() - start
+        print(f"{name}: one run {one_run:.3f}s, ticker ratio {ratio:.2f}, "
+              f"speedup on {num_threads} threads {sequential/threaded:.2f}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))